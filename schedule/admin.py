@@ -64,7 +64,7 @@ class CalendarRelationAdmin(admin.ModelAdmin):
 class EventAdmin(admin.ModelAdmin):
     list_display = ('title', 'start_in_timezone', 'event_timezone',
         'end_in_timezone', 'calendar', 'rule', 'end_recurring_period',
-        'updated_on', 'id' )
+        'last_occurrence_end', 'occurrence_count', 'updated_on', 'id' )
     list_filter = ('calendar__station','calendar', 'start', 'rule', 'end_recurring_period')
     ordering = ('-updated_on',)
     date_hierarchy = 'start'
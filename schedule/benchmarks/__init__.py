@@ -0,0 +1,8 @@
+"""
+Benchmarks for the occurrence generation hot paths.
+
+``datasets`` synthesizes calendars, events and persisted occurrences,
+``scenarios`` holds the measured operations and ``runner`` times them. Run
+them with the ``benchmark_occurrences`` management command, preferably against
+a throwaway SQLite database; the data is rolled back when the run finishes.
+"""
@@ -0,0 +1,94 @@
+import datetime
+import random
+
+import pytz
+
+from schedule.models import Calendar, Event, LivestreamUrl, Rule
+
+# (frequency, name, share of the recurring events)
+RULES = (
+    ('DAILY', 'Daily', 0.5),
+    ('WEEKLY', 'Weekly', 0.3),
+    ('HOURLY', 'Hourly', 0.05),
+    ('MONTHLY', 'Monthly', 0.15),
+)
+
+BASE_DATE = datetime.datetime(2017, 1, 1, tzinfo=pytz.utc)
+
+
+def build_dataset(station, calendars=5, events=200, persisted=100,
+                  recurring_share=0.6, seed=0, start=BASE_DATE):
+    """
+    Creates ``calendars`` calendars sharing ``events`` events, a
+    ``recurring_share`` of which recur for a year from ``start``, then
+    persists ``persisted`` of their occurrences, moving or cancelling a third
+    of them each. Returns a summary of what was created.
+    """
+    rand = random.Random(seed)
+    rules = [(Rule.objects.create(name=name, description=name, frequency=frequency), share)
+             for frequency, name, share in RULES]
+    calendar_list = []
+    for index in range(calendars):
+        livestream = LivestreamUrl.objects.create(
+            station=station, name='benchmark %d' % index,
+            page_url='http://example.com/%d' % index,
+            stream_url='http://example.com/%d/stream' % index)
+        calendar = Calendar.objects.create(
+            name='Benchmark %d' % index, slug='benchmark-%d' % index, station=station)
+        calendar_list.append((calendar, livestream))
+
+    event_list = []
+    for index in range(events):
+        calendar, livestream = rand.choice(calendar_list)
+        event_start = start + datetime.timedelta(
+            days=rand.randint(0, 30), hours=rand.randint(0, 23), minutes=rand.choice([0, 30]))
+        duration = datetime.timedelta(minutes=rand.choice([30, 60, 90, 120]))
+        rule = None
+        end_recurring_period = None
+        if rand.random() < recurring_share:
+            rule = _pick_rule(rand, rules)
+            if rule.frequency == 'HOURLY':
+                duration = datetime.timedelta(minutes=30)
+            end_recurring_period = start + datetime.timedelta(days=365)
+        event_list.append(Event.objects.create(
+            title='Event %d' % index, start=event_start, end=event_start + duration,
+            rule=rule, end_recurring_period=end_recurring_period,
+            calendar=calendar, livestreamUrl=livestream))
+
+    recurring = [event for event in event_list if event.rule is not None]
+    persisted_count = 0
+    while recurring and persisted_count < persisted:
+        event = rand.choice(recurring)
+        window_start = start + datetime.timedelta(days=rand.randint(0, 330))
+        occurrences = event.get_occurrences(window_start, window_start + datetime.timedelta(days=7))
+        occurrences = [occ for occ in occurrences if occ.pk is None]
+        if not occurrences:
+            continue
+        occurrence = rand.choice(occurrences)
+        kind = persisted_count % 3
+        if kind == 1:
+            shift = datetime.timedelta(minutes=rand.choice([-30, 30, 60]))
+            occurrence.start += shift
+            occurrence.end += shift
+        elif kind == 2:
+            occurrence.cancelled = True
+        occurrence.save()
+        persisted_count += 1
+
+    return {
+        'calendars': calendars,
+        'events': events,
+        'recurring_events': len(recurring),
+        'persisted_occurrences': persisted_count,
+        'seed': seed,
+        'start': start.isoformat(),
+    }
+
+
+def _pick_rule(rand, rules):
+    threshold = rand.random()
+    for rule, share in rules:
+        threshold -= share
+        if threshold < 0:
+            return rule
+    return rules[-1][0]
@@ -0,0 +1,57 @@
+import gc
+from timeit import default_timer
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from schedule.utils import rrule_cache
+
+try:
+    import tracemalloc
+except ImportError:  # Python 2
+    tracemalloc = None
+
+
+def measure(function, repeat=1):
+    """
+    Runs ``function`` once under tracemalloc to count its queries, peak memory
+    and result size, then ``repeat`` more times untraced and keeps the best
+    wall time. Every run starts with a cold rrule cache.
+    """
+    rrule_cache.clear()
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+    with CaptureQueriesContext(connection) as captured:
+        result = function()
+    peak_memory = None
+    if tracemalloc is not None:
+        peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    timings = []
+    for _ in range(repeat):
+        rrule_cache.clear()
+        gc.collect()
+        started = default_timer()
+        function()
+        timings.append(default_timer() - started)
+    return {
+        'seconds': min(timings) if timings else None,
+        'queries': len(captured),
+        'peak_memory_bytes': peak_memory,
+        'result_count': result if isinstance(result, int) else None,
+    }
+
+
+def run(scenarios, context, repeat=1):
+    """
+    Measures every ``(name, scenario)`` pair in ``scenarios``. A scenario is
+    called with ``context`` and returns the function to measure, so its setup
+    is not part of the numbers. Measured functions return the number of
+    occurrences (or other items) they produced.
+    """
+    results = {}
+    for name, scenario in scenarios:
+        results[name] = measure(scenario(context), repeat)
+    return results
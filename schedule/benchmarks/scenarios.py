@@ -0,0 +1,236 @@
+"""
+Benchmark scenarios. Each takes the run context (see
+``benchmark_occurrences``) and returns a function producing a count of items.
+"""
+import datetime
+
+from django import forms
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.test import RequestFactory
+
+from schedule.engine import occurrences_for_events
+from schedule.forms import check_event_conflicts
+from schedule import livenow
+from schedule.models import Event, Rule
+from schedule.models import events as events_module
+from schedule.periods import Day, Month
+from schedule.templatetags.scheduletags import _cook_slots
+from schedule.utils import EventListManager, iter_json_array
+from schedule.views import _api_occurrences, _iter_api_occurrences, live_now
+
+
+def _month(context):
+    start = context['start'] + datetime.timedelta(days=60)
+    return start, start + datetime.timedelta(days=30)
+
+
+def _year(context):
+    return context['start'], context['start'] + datetime.timedelta(days=365)
+
+
+def expand_hourly_year(context):
+    start, end = _year(context)
+    event = Event.objects.create(
+        title='Hourly benchmark', calendar=context['calendars'][0],
+        start=start, end=start + datetime.timedelta(minutes=30), end_recurring_period=end,
+        rule=Rule.objects.create(frequency='HOURLY', name='Hourly benchmark'))
+
+    def run():
+        return len(event.get_occurrences(start, end, persisted_occurrences=[]))
+    return run
+
+
+def event_get_occurrences(context):
+    start, end = _month(context)
+
+    def run():
+        count = 0
+        for event in Event.objects.filter(calendar__in=context['calendars']):
+            count += len(event.get_occurrences(start, end))
+        return count
+    return run
+
+
+def period_occurrence_partials(context):
+    date = _month(context)[0]
+
+    def run():
+        count = 0
+        for calendar in context['calendars']:
+            month = Month(calendar.events.all(), date, tzinfo=calendar.timezone)
+            count += len(month.get_occurrence_partials())
+        return count
+    return run
+
+
+def daily_table_slots(context):
+    date = _month(context)[0]
+
+    def run():
+        events = Event.objects.filter(calendar__in=context['calendars'])
+        slots = _cook_slots(Day(events, date), 30)
+        return sum(len(slot.occurrences) for slot in slots)
+    return run
+
+
+def occurrences_after(context):
+    after = _month(context)[0]
+
+    def run():
+        events = Event.objects.filter(calendar__in=context['calendars'])
+        return sum(1 for _ in EventListManager(events).occurrences_after(after, limit=1000))
+    return run
+
+
+def api_occurrences(context):
+    start, end = _month(context)
+
+    def run():
+        return len(_api_occurrences(start, end, None))
+    return run
+
+
+def api_occurrences_projected(context):
+    start, end = _month(context)
+
+    def run():
+        return len(_api_occurrences(start, end, None, fields=['id', 'title', 'start', 'end']))
+    return run
+
+
+def api_occurrences_year_buffered(context):
+    start, end = _year(context)
+
+    def run():
+        return len(JsonResponse(_api_occurrences(start, end, None), safe=False).content)
+    return run
+
+
+def api_occurrences_year_streamed(context):
+    start, end = _year(context)
+
+    def run():
+        return sum(len(chunk) for chunk in iter_json_array(_iter_api_occurrences(start, end, None)))
+    return run
+
+
+def live_now_polls_cached(context):
+    return _live_now_polls(context, False)
+
+
+def live_now_polls_uncached(context):
+    return _live_now_polls(context, True)
+
+
+def _live_now_polls(context, invalidate):
+    """
+    Serves 200 live-now polls through the view; the number of polls over the
+    measured time is the sustained poll rate of a single worker. The default
+    cache stands in for LIVENOW_CACHE when that is not set.
+    """
+    slug = context['calendars'][0].slug
+    request = RequestFactory().get('/api/livenow', {'calendar_slug': slug})
+    cache.delete(livenow.cache_key(slug))
+
+    def run():
+        configured = livenow.LIVENOW_CACHE
+        livenow.LIVENOW_CACHE = configured or 'default'
+        try:
+            for _ in range(200):
+                if invalidate:
+                    livenow.invalidate([slug])
+                live_now(request)
+        finally:
+            livenow.LIVENOW_CACHE = configured
+        return 200
+    return run
+
+
+def expand_year_fast_path(context):
+    return _expand_year(context, True)
+
+
+def expand_year_dateutil(context):
+    return _expand_year(context, False)
+
+
+def expand_year_model_occurrences(context):
+    """
+    Expands a year the way it was done before VirtualOccurrence, creating an
+    Occurrence model instance for every generated occurrence, to compare
+    allocations and peak memory with expand_year_fast_path.
+    """
+    expand = _expand_year(context, True)
+
+    def create_model_occurrence(event, start, end=None):
+        return create_occurrence(event, start, end).to_occurrence()
+
+    def run():
+        Event._create_occurrence = create_model_occurrence
+        try:
+            return expand()
+        finally:
+            Event._create_occurrence = create_occurrence
+    create_occurrence = Event._create_occurrence
+    return run
+
+
+def _expand_year(context, fast_path):
+    start, end = _year(context)
+
+    def run():
+        previous = events_module.SIMPLE_RECURRENCE_FAST_PATH
+        events_module.SIMPLE_RECURRENCE_FAST_PATH = fast_path
+        try:
+            events = Event.objects.filter(calendar__in=context['calendars'])
+            return len(occurrences_for_events(events, start, end))
+        finally:
+            events_module.SIMPLE_RECURRENCE_FAST_PATH = previous
+    return run
+
+
+class _ConflictForm(object):
+    def __init__(self, cleaned_data):
+        self.cleaned_data = cleaned_data
+        self.instance = Event()
+
+
+def check_event_conflicts_daily(context):
+    calendar = context['calendars'][0]
+    start = context['start'] + datetime.timedelta(hours=3, minutes=15)
+    form = _ConflictForm({
+        'calendar': calendar,
+        'start': start,
+        'end': start + datetime.timedelta(minutes=30),
+        'rule': Rule.objects.filter(frequency='DAILY').first(),
+        'end_recurring_period': start + datetime.timedelta(days=365),
+    })
+
+    def run():
+        try:
+            check_event_conflicts(form)
+        except forms.ValidationError as error:
+            return len(error.messages)
+        return 0
+    return run
+
+
+SCENARIOS = (
+    ('event_get_occurrences', event_get_occurrences),
+    ('period_occurrence_partials', period_occurrence_partials),
+    ('daily_table_slots', daily_table_slots),
+    ('occurrences_after', occurrences_after),
+    ('api_occurrences', api_occurrences),
+    ('api_occurrences_projected', api_occurrences_projected),
+    ('api_occurrences_year_buffered', api_occurrences_year_buffered),
+    ('api_occurrences_year_streamed', api_occurrences_year_streamed),
+    ('live_now_polls_cached', live_now_polls_cached),
+    ('live_now_polls_uncached', live_now_polls_uncached),
+    ('expand_year_fast_path', expand_year_fast_path),
+    ('expand_year_dateutil', expand_year_dateutil),
+    ('expand_year_model_occurrences', expand_year_model_occurrences),
+    ('check_event_conflicts', check_event_conflicts_daily),
+    # adds an event, so it runs last
+    ('expand_hourly_year', expand_hourly_year),
+)
@@ -1,3 +1,5 @@
+import datetime
+
 from annoying.functions import get_config
 
 # whether to display cancelled occurrences
@@ -71,7 +73,7 @@ if not CALENDAR_VIEW_PERM:
 GET_EVENTS_FUNC = get_config('GET_EVENTS_FUNC', None)
 if not GET_EVENTS_FUNC:
     def get_events(request, calendar):
-        return calendar.event_set.prefetch_related('occurrence_set', 'rule')
+        return calendar.event_set.select_related('rule', 'calendar', 'livestreamUrl')
 
     GET_EVENTS_FUNC = get_events
 
@@ -84,3 +86,69 @@ USE_FULLCALENDAR = get_config('USE_FULLCALENDAR', False)
 
 # This name is used when a new event is created through selecting in fullcalendar
 EVENT_NAME_PLACEHOLDER = get_config('EVENT_NAME_PLACEHOLDER', 'Event Name')
+
+# Whether Period and the JSON API answer window queries from the precomputed
+# OccurrenceIndex table instead of expanding every event's rrule per request.
+USE_OCCURRENCE_INDEX = get_config('USE_OCCURRENCE_INDEX', False)
+
+# How far ahead of now recurring events are materialized into the
+# OccurrenceIndex. Windows ending beyond it fall back to rrule expansion.
+OCCURRENCE_INDEX_HORIZON = get_config('OCCURRENCE_INDEX_HORIZON', datetime.timedelta(days=548))  # ~18 months
+
+# How far back from now the OccurrenceIndex is materialized. Windows starting
+# earlier fall back to rrule expansion.
+OCCURRENCE_INDEX_LOOKBACK = get_config('OCCURRENCE_INDEX_LOOKBACK', datetime.timedelta(days=90))
+
+# Number of compiled rrule objects kept in the process-wide cache used by
+# Event.get_rrule_object (see schedule.utils.rrule_cache). 0 disables it.
+RRULE_CACHE_SIZE = get_config('RRULE_CACHE_SIZE', 1000)
+
+# Alias of the Django cache holding precomputed /api/livenow responses, or
+# None to compute every poll from scratch. The cache has to be shared by all
+# workers, or writes only invalidate the responses of the worker making them.
+LIVENOW_CACHE = get_config('LIVENOW_CACHE', None)
+
+# Alias of the Django cache holding rendered iCal feeds, keyed by a version of
+# their calendar's events and occurrences, or None to render every request.
+ICAL_CACHE = get_config('ICAL_CACHE', 'default')
+
+# Longest time (in seconds) a cached /api/livenow response is served for.
+# Responses are otherwise kept until the next occurrence boundary or until an
+# event, occurrence, rule or calendar write invalidates them.
+LIVENOW_CACHE_MAX_AGE = get_config('LIVENOW_CACHE_MAX_AGE', 300)
+
+# Whether /api/occurrences streams its JSON array as occurrences are expanded
+# instead of building the whole response in memory. Clients can also ask for
+# either mode with the ``stream`` query parameter.
+STREAM_OCCURRENCES_API = get_config('STREAM_OCCURRENCES_API', False)
+
+# Largest page /api/occurrences returns when a client passes ``limit``; larger
+# limits are lowered to it.
+OCCURRENCES_API_MAX_LIMIT = get_config('OCCURRENCES_API_MAX_LIMIT', 1000)
+
+# Whether plain HOURLY/DAILY/WEEKLY rules are expanded arithmetically (see
+# schedule.recurrence) instead of by iterating dateutil's rrule from the start
+# of the event.
+SIMPLE_RECURRENCE_FAST_PATH = get_config('SIMPLE_RECURRENCE_FAST_PATH', True)
+
+# Executor used to expand large event lists on several cores: 'process' (a
+# concurrent.futures process pool), 'thread' (a thread pool) or None to always
+# expand serially. Events are partitioned by calendar.
+PARALLEL_EXPANSION = get_config('PARALLEL_EXPANSION', None)
+
+# Number of pool workers; None starts one per CPU.
+PARALLEL_EXPANSION_WORKERS = get_config('PARALLEL_EXPANSION_WORKERS', None)
+
+# Event lists shorter than this are expanded serially, where handing the work
+# to the pool would cost more than it saves.
+PARALLEL_EXPANSION_THRESHOLD = get_config('PARALLEL_EXPANSION_THRESHOLD', 200)
+
+# Whether schedule.middleware.InstrumentationMiddleware collects per-request
+# counters (events expanded, occurrences generated, persisted occurrences matched,
+# SQL queries) and phase timings, and reports them in a Server-Timing header.
+INSTRUMENTATION = get_config('INSTRUMENTATION', False)
+
+# Callable receiving (request, stats) for every instrumented request, e.g. to
+# log the numbers or send them to statsd. ``stats.as_dict()`` returns the
+# counters and the phase timings in milliseconds.
+INSTRUMENTATION_HOOK_FUNC = get_config('INSTRUMENTATION_HOOK_FUNC', None)
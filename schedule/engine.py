@@ -0,0 +1,302 @@
+"""
+Bulk occurrence generation for many events at once.
+
+Expanding events one by one through ``Event.get_occurrences`` costs a query for
+each event's persisted occurrences plus lazy lookups of its rule, calendar and
+livestream url. The functions here fetch all of that for a whole batch of
+events up front so a request issues a constant number of queries.
+"""
+from collections import defaultdict
+import heapq
+import itertools
+import multiprocessing
+import threading
+
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from schedule.conf.settings import (PARALLEL_EXPANSION, PARALLEL_EXPANSION_WORKERS,
+                                    PARALLEL_EXPANSION_THRESHOLD)
+from schedule import instrumentation
+from schedule.instrumentation import current, incr, phase
+from schedule.models import Occurrence
+from schedule.models.events import PERSISTED_OCCURRENCES_WINDOW, loaded_events
+from schedule.utils import OccurrenceReplacer
+
+try:
+    from concurrent import futures
+except ImportError:  # Python 2 without the futures backport
+    futures = None
+
+# Event relations prepare_events joins in.
+JOINED_RELATIONS = ('rule', 'calendar', 'livestreamUrl')
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def prepare_events(events):
+    """
+    Returns ``events`` as a list, joining in the relations occurrence
+    generation and serialization touch when given a queryset. They are added
+    to the queryset's own joins, leaving out relations whose column it
+    defers.
+    """
+    if isinstance(events, QuerySet) and events.query.select_related is not True:
+        names, defer = events.query.deferred_loading
+        related = [name for name in JOINED_RELATIONS
+                   if not names or (name in names) != defer]
+        events = events.select_related(*related)
+    with phase('events'):
+        return list(events)
+
+
+def persisted_occurrences_for_events(events, start=None, end=None, occurrences=None):
+    """
+    Fetches the persisted occurrences of all ``events`` in one query and
+    returns them grouped by event id, with ``occurrence.event`` pointing at the
+    already loaded event instances. The events are handed in before the
+    occurrences fill in their defaults from them, so that costs no query.
+    Given a window, only the occurrences that can show up in it are fetched. ``occurrences`` is the Occurrence queryset
+    to fetch them from, for callers that project or join differently.
+    """
+    events_by_id = dict((event.pk, event) for event in events if event.pk is not None)
+    persisted = defaultdict(list)
+    if not events_by_id:
+        return persisted
+    if occurrences is None:
+        occurrences = Occurrence.objects.select_related('livestreamUrl')
+    occurrences = occurrences.filter(event__in=list(events_by_id))
+    if start is not None and end is not None:
+        occurrences = occurrences.in_window(start, end, _longest_duration(events))
+    with phase('persisted'), loaded_events(events_by_id):
+        for occurrence in occurrences:
+            persisted[occurrence.event_id].append(occurrence)
+    return persisted
+
+
+def iter_occurrences_for_events(events, start, end, occurrences=None):
+    """
+    Yields the occurrences of all ``events`` between ``start`` and ``end``,
+    persisted occurrences included, in the order of ``events``. Events are
+    expanded one at a time as the generator is consumed. ``occurrences`` is
+    passed on to persisted_occurrences_for_events.
+
+    With PARALLEL_EXPANSION set, lists of at least
+    PARALLEL_EXPANSION_THRESHOLD events are instead expanded in the pool, and
+    the occurrences are yielded in the same order once all of them are ready.
+    """
+    events = prepare_events(events)
+    persisted = persisted_occurrences_for_events(events, start, end, occurrences)
+    executor = get_executor() if len(events) >= PARALLEL_EXPANSION_THRESHOLD else None
+    if executor is not None:
+        for occurrence in _expand_in_parallel(executor, events, persisted, start, end):
+            yield occurrence
+        return
+    for event in events:
+        for occurrence in event.get_occurrences(
+                start, end, persisted_occurrences=persisted[event.pk]):
+            yield occurrence
+
+
+def get_executor():
+    """
+    Returns the process-wide pool configured by PARALLEL_EXPANSION, creating
+    it on first use, or None when expansion is serial.
+    """
+    global _executor
+    if PARALLEL_EXPANSION is None or futures is None:
+        return None
+    with _executor_lock:
+        if _executor is None:
+            if PARALLEL_EXPANSION == 'process':
+                _executor = futures.ProcessPoolExecutor(_workers())
+            else:
+                _executor = futures.ThreadPoolExecutor(_workers())
+        return _executor
+
+
+def _workers():
+    return PARALLEL_EXPANSION_WORKERS or multiprocessing.cpu_count()
+
+
+def shutdown_executor():
+    """
+    Shuts the pool down, waiting for running tasks; the next get_executor()
+    call starts a new one with the current settings.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def _expand_in_parallel(executor, events, persisted, start, end):
+    """
+    Expands ``events`` in one task per worker and yields the results in the
+    order of ``events``, like serial expansion. Tasks take the events of a
+    calendar together where they can, and a large calendar is split across
+    several of them. Events and persisted
+    occurrences have been loaded by the caller, so tasks never touch the
+    database. Occurrences coming back from a process pool hold unpickled
+    copies of their event, which are swapped for the caller's. The counters
+    the tasks collect are added to the caller's instrumentation, which is
+    thread-local and does not reach the workers.
+    """
+    by_calendar = defaultdict(list)
+    for index, event in enumerate(events):
+        by_calendar[event.calendar_id].append((index, event, persisted[event.pk]))
+    items = list(itertools.chain.from_iterable(by_calendar.values()))
+    size = -(-len(items) // _workers())
+    partitions = [items[offset:offset + size] for offset in range(0, len(items), size)]
+    instrumented = current() is not None
+    with phase('expand'):
+        tasks = [executor.submit(_expand_partition, partition, start, end, instrumented)
+                 for partition in partitions]
+        expanded = [None] * len(events)
+        for task in tasks:
+            results, counters = task.result()
+            for index, occurrences in results:
+                expanded[index] = occurrences
+            for name, amount in counters.items():
+                incr(name, amount)
+    for event, occurrences in zip(events, expanded):
+        for occurrence in occurrences:
+            if occurrence.event is not event:
+                _set_event(occurrence, event)
+            yield occurrence
+
+
+def _expand_partition(partition, start, end, instrumented):
+    if instrumented:
+        instrumentation.start()
+    try:
+        results = [(index, event.get_occurrences(start, end, persisted_occurrences=persisted))
+                   for index, event, persisted in partition]
+    finally:
+        stats = instrumentation.stop() if instrumented else None
+    return results, dict(stats.counters) if stats is not None else {}
+
+
+def _set_event(occurrence, event):
+    if isinstance(occurrence, Occurrence):
+        occurrence.event = event
+    else:
+        occurrence._event = event
+
+
+def occurrences_for_events(events, start, end):
+    return list(iter_occurrences_for_events(events, start, end))
+
+
+def iter_occurrences_after(events, after=None, until=None, limit=None, resume_after=None,
+                           occurrences=None):
+    """
+    Yields the occurrences of ``events`` ending after ``after`` in start order,
+    persisted occurrences included, stopping before ``until`` or after
+    ``limit`` occurrences. ``events`` may span several calendars.
+
+    Occurrences are ordered by ``occurrence_key``. Given the key of an
+    occurrence as ``resume_after``, iteration resumes right after it: event
+    generators and the persisted query skip everything starting earlier
+    instead of handing it to the merge. Persisted occurrences are streamed
+    from the ``occurrences`` queryset when one is given.
+
+    Every event contributes a lazy generator and the persisted occurrences are
+    streamed from one query ordered by start; they are k-way merged on
+    (start, event id, original start, sequence) keys, so memory stays
+    proportional to the number of events however far the iteration goes.
+    The identifying (event, original start, original end) tuples of persisted
+    occurrences, used to drop the generated occurrences they replace, are
+    loaded PERSISTED_OCCURRENCES_WINDOW at a time as the generators get to
+    them, and dropped once matched.
+    """
+    if after is None:
+        after = timezone.now()
+    events = prepare_events(events)
+    events_by_id = dict((event.pk, event) for event in events if event.pk is not None)
+    resume_start = resume_after[0] if resume_after is not None else None
+
+    replacer = OccurrenceReplacer()
+    persisted = iter(())
+    keys = None
+    # generated occurrences ending after ``after`` start after this
+    loaded_until = [after - _longest_duration(events)] if events else []
+    if resume_start is not None and events:
+        loaded_until[0] = max(loaded_until[0], resume_start)
+    if events_by_id:
+        keys = Occurrence.objects.filter(event__in=list(events_by_id)).values_list(
+            'event_id', 'original_start', 'original_end')
+        if occurrences is None:
+            occurrences = Occurrence.objects.select_related('livestreamUrl')
+        occurrences = occurrences.filter(event__in=list(events_by_id), end__gt=after)
+        if until is not None:
+            occurrences = occurrences.filter(start__lt=until)
+        if resume_after is not None:
+            occurrences = occurrences.filter(start__gte=resume_start)
+        persisted = _with_events(
+            occurrences.order_by('start', 'event_id', 'original_start', 'pk').iterator(),
+            events_by_id)
+
+    def load_keys(original_start):
+        window_start = loaded_until[0]
+        loaded_until[0] = original_start + PERSISTED_OCCURRENCES_WINDOW
+        with phase('persisted'):
+            replacer.add(keys.filter(original_start__gte=window_start,
+                                     original_start__lt=loaded_until[0]))
+
+    def generated(event):
+        for occurrence in event._occurrences_after_generator(after, resume_start):
+            if keys is not None and occurrence.original_start >= loaded_until[0]:
+                load_keys(occurrence.original_start)
+            # a match also drops the key, nothing else can replace it
+            if not replacer.drop(occurrence):
+                yield occurrence
+
+    heap = []
+    sequence = itertools.count()
+    for source in [generated(event) for event in events] + [persisted]:
+        _push_next(heap, source, sequence)
+
+    count = 0
+    while heap and (limit is None or count < limit):
+        start, event_id, original_start, _, occurrence, source = heapq.heappop(heap)
+        if until is not None and start >= until:
+            break
+        if resume_after is not None and (start, event_id, original_start) <= resume_after:
+            # same start as the resumed occurrence, but ordered before it
+            _push_next(heap, source, sequence)
+            continue
+        yield occurrence
+        count += 1
+        _push_next(heap, source, sequence)
+
+
+def _longest_duration(events):
+    return max(event.end - event.start for event in events)
+
+
+def _with_events(occurrences, events_by_id):
+    # only the rows fetched by next() are instantiated with the loaded events
+    occurrences = iter(occurrences)
+    while True:
+        with loaded_events(events_by_id):
+            occurrence = next(occurrences, None)
+        if occurrence is None:
+            return
+        yield occurrence
+
+
+def occurrence_key(occurrence):
+    """
+    The (start, event id, original start) key iter_occurrences_after orders
+    occurrences by.
+    """
+    return (occurrence.start, occurrence.event_id or 0, occurrence.original_start)
+
+
+def _push_next(heap, source, sequence):
+    for occurrence in source:
+        heapq.heappush(heap, occurrence_key(occurrence) + (next(sequence), occurrence, source))
+        return
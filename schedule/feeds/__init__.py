@@ -1,10 +1,10 @@
 from django.utils.six.moves.builtins import str
-from schedule.models import Calendar
+from schedule.models import Calendar, Event, Occurrence
 from django.contrib.syndication.views import Feed, FeedDoesNotExist
 from django.core.exceptions import ObjectDoesNotExist
+from django.db.models import Count, Max
 from django.conf import settings
 from schedule.feeds.ical import ICalendarFeed
-import itertools
 from django.utils import timezone
 
 
@@ -25,9 +25,8 @@ class UpcomingEventsFeed(Feed):
         return obj.get_absolute_url()
 
     def items(self, obj):
-        return itertools.islice(
-            obj.occurrences_after(timezone.now()),
-            getattr(settings, "FEED_LIST_LENGTH", 10))
+        return obj.occurrences_after(
+            timezone.now(), limit=getattr(settings, "FEED_LIST_LENGTH", 10))
 
     def item_id(self, item):
         return str(item.id)
@@ -54,6 +53,16 @@ class CalendarICalendar(ICalendarFeed):
 
         return cal.events.all()
 
+    def version(self):
+        # deletions lower a count, any other write bumps an updated_on
+        cal_id = self.args[1]
+        events = Event.objects.filter(calendar=cal_id).aggregate(Max('updated_on'), Count('id'))
+        occurrences = Occurrence.objects.filter(event__calendar=cal_id).aggregate(
+            Max('updated_on'), Count('id'))
+        return 'calendar:%s:%s:%s:%s:%s' % (
+            cal_id, events['updated_on__max'], events['id__count'],
+            occurrences['updated_on__max'], occurrences['id__count'])
+
     def item_uid(self, item):
         return str(item.id)
 
@@ -1,7 +1,14 @@
 from django.utils.six.moves.builtins import str
+import hashlib
+import time
 import icalendar
 
-from django.http import HttpResponse
+from django.core.cache import caches
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+
+from schedule.conf.settings import ICAL_CACHE
+from schedule.utils import is_not_modified
 
 EVENT_ITEMS = (
     ('uid', 'uid'),
@@ -20,6 +27,30 @@ class ICalendarFeed(object):
         self.args = args
         self.kwargs = kwargs
 
+        version = self.version()
+        if version is None:
+            return self.response(self.render())
+
+        # the content behind a version never changes, so its rendered bytes
+        # are cached along with the time they were first served
+        etag = '"%s"' % hashlib.md5(version.encode('utf-8')).hexdigest()
+        cache = caches[ICAL_CACHE] if ICAL_CACHE is not None else None
+        cache_key = 'schedule:ical:%s' % etag.strip('"')
+        cached = cache.get(cache_key) if cache is not None else None
+        if cached is None:
+            cached = (self.render(), int(time.time()))
+            if cache is not None:
+                cache.set(cache_key, cached)
+        content, last_modified = cached
+
+        if is_not_modified(args[0], etag, last_modified):
+            return HttpResponseNotModified()
+        response = self.response(content)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def render(self):
         cal = icalendar.Calendar()
         cal.add('prodid', '-// django-scheduler //')
         cal.add('version', '2.0')
@@ -34,11 +65,21 @@ class ICalendarFeed(object):
 
             cal.add_component(event)
 
-        response = HttpResponse(cal.to_ical())
-        response['Content-Type'] = 'text/calendar'
+        return cal.to_ical()
 
+    def response(self, content):
+        response = HttpResponse(content)
+        response['Content-Type'] = 'text/calendar'
         return response
 
+    def version(self):
+        """
+        A string that changes whenever the feed's content does, or None to
+        render the feed on every request. Feeds with a version answer
+        conditional GETs and have their rendered bytes cached in ICAL_CACHE.
+        """
+        return None
+
     def items(self):
         return []
 
@@ -1,9 +1,10 @@
 from django import forms
 from django.utils.translation import ugettext_lazy as _
 from django.utils import timezone
+from schedule.engine import occurrences_for_events
 from schedule.models import Event, Occurrence, Calendar, Rule, LivestreamUrl
-from schedule.periods import Period
 import datetime
+import heapq
 import pytz
 
 
@@ -96,28 +97,79 @@ def time_conflicts(start1,end1,start2,end2):
     return False
 
 
-def check_occ_conflicts(occ, events):
+def find_conflicts(occurrences, others):
     """
-    Checks to see if an occurrence (occ) conflicts with any occurrence of an
-    event queryset (events).
+    Returns every (occurrence, other) pair where one of ``occurrences``
+    overlaps one of ``others``, in the order of the occurrences' starts.
+    Cancelled occurrences never conflict, and back to back occurrences
+    (one ending exactly when the other starts) do not overlap.
+
+    Both lists are sorted by start once and swept together, keeping a heap of
+    the others that started before the current occurrence ends ordered by
+    their end, so the check is O((n + m) log m) plus the number of conflicts
+    instead of comparing every pair.
     """
-    # Don't conflict check on a cancelled occurrence
-    if occ.cancelled:
-        return
+    others = sorted((other for other in others if not other.cancelled),
+                    key=lambda other: other.start)
+    occurrences = sorted((occ for occ in occurrences if not occ.cancelled),
+                         key=lambda occ: occ.start)
+    conflicts = []
+    active = []
+    index = 0
+    for occ in occurrences:
+        while index < len(others) and others[index].start < occ.end:
+            heapq.heappush(active, (others[index].end, index, others[index]))
+            index += 1
+        # occurrences are swept in start order, so others that ended by now
+        # cannot overlap any of the remaining ones either
+        while active and active[0][0] <= occ.start:
+            heapq.heappop(active)
+        overlapping = [(position, other) for _, position, other in active if other.start < occ.end]
+        conflicts.extend((occ, other) for _, other in sorted(overlapping, key=lambda item: item[0]))
+    return conflicts
+
+
+def get_conflicts(occurrences, events):
+    """
+    Returns the (occurrence, conflicting occurrence) pairs between
+    ``occurrences`` and the occurrences of the ``events`` queryset, expanding
+    the events once over the whole span of ``occurrences``.
+    """
+    occurrences = [occ for occ in occurrences if not occ.cancelled]
+    if not occurrences:
+        return []
+    span_start = min(occ.start for occ in occurrences)
+    span_end = max(occ.end for occ in occurrences)
+    others = occurrences_for_events(events.overlapping(span_start, span_end), span_start, span_end)
+    return find_conflicts(occurrences, others)
 
-    period = Period(events, occ.start, occ.end)
-    for pocc in period.occurrences:
-        if not pocc.cancelled:
-            if time_conflicts(occ.start, occ.end, pocc.start, pocc.end):
-                tz = pocc.event.calendar.timezone
-                fmt = '%Y-%m-%d %H:%M%Z'
-                raise forms.ValidationError(
+
+def conflicts_error(conflicts):
+    """
+    A ValidationError listing every conflicting occurrence in ``conflicts``.
+    """
+    fmt = '%Y-%m-%d %H:%M%Z'
+    messages = []
+    for _, pocc in conflicts:
+        tz = pocc.event.calendar.timezone
+        messages.append(
             """ Conflicts with an Occurrence of Event '%(title)s' (id = %(pk)s)!
             Conflicting occurrence runs %(starttime)s -- %(endtime)s. """%{
             'title': pocc.title,
             'pk': pocc.event.pk,
             'starttime': tz.normalize(pocc.start).strftime(fmt),
             'endtime': tz.normalize(pocc.end).strftime(fmt)})
+    return forms.ValidationError(messages)
+
+
+def check_occ_conflicts(occ, events):
+    """
+    Checks to see if an occurrence (occ) conflicts with any occurrence of an
+    event queryset (events).
+    """
+    conflicts = get_conflicts([occ], events)
+    if conflicts:
+        raise conflicts_error(conflicts)
 
 def check_event_conflicts(form):
     calendar = form.cleaned_data.get('calendar')
@@ -151,12 +203,12 @@ def check_event_conflicts(form):
             end_recurring_period=end_recurring_period, title='temp_placeholder')
 
     if not rule :
-        occ =event.get_occurrence(event.start)
-        check_occ_conflicts(occ, events)
+        e_occs = [event.get_occurrence(event.start)]
     elif rule:
         e_occs = event.get_occurrences(start, end_recurring_period)
-        for occ in e_occs:
-            check_occ_conflicts(occ, events)
+    conflicts = get_conflicts(e_occs, events)
+    if conflicts:
+        raise conflicts_error(conflicts)
 
 def check_occurrence_conflicts(form):
     start = form.cleaned_data.get('start')
@@ -0,0 +1,129 @@
+"""
+Opt-in, per-request instrumentation of occurrence generation.
+
+While a request is being instrumented (see
+``schedule.middleware.InstrumentationMiddleware``) the scheduler's hot paths
+bump counters with ``incr`` and time themselves with ``phase``. Both are
+no-ops outside an instrumented request, so the calls can stay in the code
+paths unconditionally.
+
+SQL queries are counted by wrapping the cursors of the default database
+connection for the duration of the request. Only the queries issued inside a
+``phase`` are attributed to schedule.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from timeit import default_timer
+import threading
+
+from django.db import connection
+from django.db.backends.utils import CursorWrapper
+
+_state = threading.local()
+
+
+class RequestStats(object):
+    """
+    Counters and per-phase wall times (in seconds) collected during a request.
+    """
+
+    def __init__(self):
+        self.counters = defaultdict(int)
+        self.timings = defaultdict(float)
+        self._depth = 0
+
+    def as_dict(self):
+        return {
+            'counters': dict(self.counters),
+            'timings': dict((name, seconds * 1000) for name, seconds in self.timings.items()),
+        }
+
+    def server_timing(self):
+        """
+        Formats the stats as a ``Server-Timing`` header value: one metric with a
+        duration (in milliseconds) per phase and one with a description per
+        counter, all prefixed with ``schedule-``.
+        """
+        metrics = ['schedule-%s;dur=%.3f' % (name, seconds * 1000)
+                   for name, seconds in sorted(self.timings.items())]
+        metrics += ['schedule-%s;desc="%d"' % (name, value)
+                    for name, value in sorted(self.counters.items())]
+        return ', '.join(metrics)
+
+
+def current():
+    return getattr(_state, 'stats', None)
+
+
+def start():
+    """
+    Starts collecting stats for the current thread and returns them.
+    """
+    stats = RequestStats()
+    _state.stats = stats
+    make_cursor, make_debug_cursor = connection.make_cursor, connection.make_debug_cursor
+    connection.make_cursor = lambda cursor: CountingCursorWrapper(make_cursor(cursor), connection)
+    connection.make_debug_cursor = lambda cursor: CountingCursorWrapper(
+        make_debug_cursor(cursor), connection)
+    return stats
+
+
+def stop():
+    """
+    Stops collecting stats for the current thread and returns them, or None if
+    no collection was started.
+    """
+    stats = current()
+    if stats is not None:
+        # drop the instance attributes set by start()
+        del connection.make_cursor
+        del connection.make_debug_cursor
+        _state.stats = None
+    return stats
+
+
+class CountingCursorWrapper(CursorWrapper):
+    """
+    Counts the statements executed inside a phase in the ``queries`` counter.
+    Unlike ``connection.queries_log`` this is not capped, so long requests are
+    counted in full.
+    """
+
+    def execute(self, sql, params=None):
+        _count_query()
+        return super(CountingCursorWrapper, self).execute(sql, params)
+
+    def executemany(self, sql, param_list):
+        _count_query()
+        return super(CountingCursorWrapper, self).executemany(sql, param_list)
+
+
+def _count_query():
+    stats = current()
+    if stats is not None and stats._depth:
+        stats.counters['queries'] += 1
+
+
+def incr(name, amount=1):
+    stats = current()
+    if stats is not None:
+        stats.counters[name] += amount
+
+
+@contextmanager
+def phase(name):
+    """
+    Adds the time spent in the block to the ``name`` phase, and the queries it
+    issues to the ``queries`` counter.
+    """
+    stats = current()
+    if stats is None:
+        yield
+        return
+    stats._depth += 1
+    started = default_timer()
+    try:
+        yield
+    finally:
+        stats.timings[name] += default_timer() - started
+        stats._depth -= 1
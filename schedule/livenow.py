@@ -0,0 +1,112 @@
+"""
+Cache of ``/api/livenow`` responses.
+
+What is live on a calendar only changes when an occurrence starts or ends, or
+when the calendar's events are edited, so the live-now view stores each
+calendar's response together with the time of its next occurrence boundary and
+serves it from the cache until then. Writes to events, occurrences, rules and
+calendars drop the affected entries (see schedule.signals).
+
+Entries outlive their boundary by LIVENOW_STALE_GRACE so that, when one
+expires while thousands of devices are polling, a single worker recomputes it
+and the others keep answering from the previous response in the meantime. A
+recomputed response with the same content as the previous one keeps its
+Last-Modified time, so conditional GETs still get a 304.
+
+Invalidation only reaches the workers sharing the cache, so LIVENOW_CACHE has
+to name a cache shared by all of them (memcached, redis or the database
+cache, not a per-process local-memory cache).
+"""
+import datetime
+
+from django.core.cache import caches
+
+from schedule.conf.settings import LIVENOW_CACHE
+
+# The live-now view reports the occurrences overlapping this window from now.
+LIVENOW_WINDOW = datetime.timedelta(seconds=10)
+
+ALL_CALENDARS = '__all__'
+
+# How long an expired response may still be served while another worker
+# recomputes it, and how long that worker holds the recompute lock at most.
+LIVENOW_STALE_GRACE = datetime.timedelta(seconds=30)
+
+
+def _get_cache():
+    if LIVENOW_CACHE is None:
+        return None
+    return caches[LIVENOW_CACHE]
+
+
+def cache_key(calendar_slug):
+    return 'schedule:livenow:%s' % (calendar_slug or ALL_CALENDARS)
+
+
+def lock_key(calendar_slug):
+    return '%s:lock' % cache_key(calendar_slug)
+
+
+def get_cached(calendar_slug, now):
+    """
+    Returns the cached payload of a calendar (or of all calendars when
+    ``calendar_slug`` is empty) if it is still valid at ``now``.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return None
+    payload = cache.get(cache_key(calendar_slug))
+    if payload is not None and payload['expires'] > now:
+        return payload
+    return None
+
+
+def set_cached(calendar_slug, payload, now):
+    cache = _get_cache()
+    if cache is None:
+        return
+    timeout = int((payload['expires'] - now + LIVENOW_STALE_GRACE).total_seconds()) + 1
+    cache.set(cache_key(calendar_slug), payload, timeout)
+
+
+def get_or_compute(calendar_slug, now, compute):
+    """
+    Returns the payload of a calendar at ``now``, calling ``compute()`` and
+    caching its result when the cached one has expired. Only the worker
+    holding the recompute lock calls ``compute()`` for an expired payload;
+    concurrent polls get the expired one until the new one is stored. Without
+    any cached payload (first poll, or after a write) everyone computes.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return compute()
+    stale = cache.get(cache_key(calendar_slug))
+    if stale is not None and stale['expires'] > now:
+        return stale
+    if stale is not None:
+        lock_timeout = int(LIVENOW_STALE_GRACE.total_seconds())
+        if not cache.add(lock_key(calendar_slug), True, lock_timeout):
+            return stale
+    try:
+        payload = compute()
+        if stale is not None and stale['etag'] == payload['etag']:
+            # nothing changed since the stale payload was computed
+            payload['last_modified'] = stale['last_modified']
+        set_cached(calendar_slug, payload, now)
+    finally:
+        if stale is not None:
+            cache.delete(lock_key(calendar_slug))
+    return payload
+
+
+def invalidate(calendar_slugs):
+    """
+    Drops the cached responses of ``calendar_slugs`` and the all-calendars
+    response, which includes them.
+    """
+    cache = _get_cache()
+    if cache is None:
+        return
+    keys = [cache_key(slug) for slug in calendar_slugs if slug]
+    keys.append(cache_key(None))
+    cache.delete_many(keys)
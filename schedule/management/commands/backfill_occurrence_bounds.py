@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ("Recompute the first_occurrence_start, last_occurrence_end and occurrence_count "
+            "of events (needed once for events saved before those columns existed)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calendar', dest='calendar_slug', default=None,
+                            help="Only update the events of the calendar with this slug")
+        parser.add_argument('--missing', action='store_true', default=False,
+                            help="Only update events whose bounds were never computed")
+
+    def handle(self, *args, **options):
+        from schedule.models import Event
+
+        events = Event.objects.select_related('rule', 'calendar')
+        if options['calendar_slug']:
+            events = events.filter(calendar__slug=options['calendar_slug'])
+        if options['missing']:
+            events = events.filter(first_occurrence_start__isnull=True, occurrence_count__isnull=True)
+        updated = 0
+        for event in events.iterator():
+            event.update_occurrence_bounds()
+            # update() skips save() and its signals, nothing else changed
+            Event.objects.filter(pk=event.pk).update(
+                first_occurrence_start=event.first_occurrence_start,
+                last_occurrence_end=event.last_occurrence_end,
+                occurrence_count=event.occurrence_count)
+            updated += 1
+        self.stdout.write("Updated the occurrence bounds of %d events" % updated)
@@ -0,0 +1,70 @@
+import json
+import platform
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+
+class Command(BaseCommand):
+    help = ("Benchmark occurrence generation on a synthetic dataset and print the results as JSON. "
+            "The dataset is rolled back afterwards; run it against a throwaway SQLite database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calendars', type=int, default=5)
+        parser.add_argument('--events', type=int, default=200)
+        parser.add_argument('--persisted', type=int, default=100,
+                            help="Number of persisted (plain, moved or cancelled) occurrences")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--repeat', type=int, default=3,
+                            help="Timed runs per scenario; the best is reported")
+        parser.add_argument('--scenario', action='append', dest='scenarios',
+                            help="Only run this scenario (may be given several times)")
+        parser.add_argument('--output', default=None,
+                            help="Write the JSON report to this file instead of stdout")
+
+    def handle(self, *args, **options):
+        from schedule.benchmarks.datasets import BASE_DATE, build_dataset
+        from schedule.benchmarks.runner import run
+        from schedule.benchmarks.scenarios import SCENARIOS
+        from schedule.models import Calendar
+
+        scenarios = SCENARIOS
+        if options['scenarios']:
+            known = dict(SCENARIOS)
+            unknown = [name for name in options['scenarios'] if name not in known]
+            if unknown:
+                raise CommandError("Unknown scenarios: %s" % ', '.join(unknown))
+            scenarios = [(name, known[name]) for name in options['scenarios']]
+
+        station_model = Calendar._meta.get_field('station').related_model
+        station = station_model.objects.first()
+        if station is None:
+            raise CommandError("The benchmark needs an existing %s to own its calendars." %
+                               station_model._meta.verbose_name)
+
+        with transaction.atomic():
+            dataset = build_dataset(
+                station, options['calendars'], options['events'], options['persisted'],
+                seed=options['seed'])
+            context = {
+                'start': BASE_DATE,
+                'calendars': list(Calendar.objects.filter(slug__startswith='benchmark-')),
+            }
+            results = run(scenarios, context, options['repeat'])
+            transaction.set_rollback(True)
+
+        report = json.dumps({
+            'meta': {
+                'dataset': dataset,
+                'repeat': options['repeat'],
+                'python': platform.python_version(),
+                'django': django.get_version(),
+            },
+            'scenarios': results,
+        }, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(report)
+        else:
+            self.stdout.write(report)
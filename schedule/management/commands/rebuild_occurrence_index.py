@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the occurrence index from OCCURRENCE_INDEX_LOOKBACK before now up to "
+            "OCCURRENCE_INDEX_HORIZON (run daily to roll it forward)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--calendar', dest='calendar_slug', default=None,
+                            help="Only rebuild the events of the calendar with this slug")
+
+    def handle(self, *args, **options):
+        from schedule.models import Event
+        from schedule.models import OccurrenceIndex
+
+        events = Event.objects.select_related('rule', 'calendar')
+        if options['calendar_slug']:
+            events = events.filter(calendar__slug=options['calendar_slug'])
+        rows = 0
+        for event in events:
+            rows += len(OccurrenceIndex.objects.rebuild_for_event(event))
+        self.stdout.write("Indexed %d occurrences for %d events" % (rows, events.count()))
@@ -0,0 +1,34 @@
+try:
+    from django.utils.deprecation import MiddlewareMixin
+except ImportError:  # Django < 1.10
+    MiddlewareMixin = object
+
+from schedule import instrumentation
+from schedule.conf.settings import INSTRUMENTATION, INSTRUMENTATION_HOOK_FUNC
+
+
+class InstrumentationMiddleware(MiddlewareMixin):
+    """
+    Collects ``schedule.instrumentation`` stats for every request when the
+    INSTRUMENTATION setting is on, reports them in a ``Server-Timing`` header
+    and passes them to INSTRUMENTATION_HOOK_FUNC.
+
+    Streamed responses are reported when the response leaves the middleware,
+    before their body has been generated. Works in both MIDDLEWARE and
+    MIDDLEWARE_CLASSES.
+    """
+
+    def process_request(self, request):
+        if INSTRUMENTATION:
+            instrumentation.start()
+
+    def process_response(self, request, response):
+        stats = instrumentation.stop()
+        if stats is None:
+            return response
+        header = stats.server_timing()
+        if header:
+            response['Server-Timing'] = header
+        if INSTRUMENTATION_HOOK_FUNC is not None:
+            INSTRUMENTATION_HOOK_FUNC(request, stats)
+        return response
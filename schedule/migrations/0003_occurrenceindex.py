@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0002_auto_20170201_1155'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccurrenceIndex',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('utc_start', models.DateTimeField(db_index=True, verbose_name='start')),
+                ('utc_end', models.DateTimeField(verbose_name='end')),
+                ('original_start', models.DateTimeField(verbose_name='original start')),
+                ('cancelled', models.BooleanField(default=False, verbose_name='cancelled')),
+                ('event', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='schedule.Event', verbose_name='event')),
+                ('occurrence', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='schedule.Occurrence', verbose_name='occurrence')),
+            ],
+            options={
+                'verbose_name': 'occurrence index',
+                'verbose_name_plural': 'occurrence index',
+            },
+        ),
+    ]
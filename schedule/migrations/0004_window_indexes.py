@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0003_occurrenceindex'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='event',
+            index_together=set([('calendar', 'start'), ('calendar', 'end_recurring_period')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='occurrence',
+            index_together=set([('event', 'original_start')]),
+        ),
+    ]
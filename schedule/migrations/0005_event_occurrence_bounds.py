@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0004_window_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='first_occurrence_start',
+            field=models.DateTimeField(null=True, blank=True, editable=False, verbose_name='first occurrence start'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='last_occurrence_end',
+            field=models.DateTimeField(null=True, blank=True, editable=False, verbose_name='last occurrence end'),
+        ),
+        migrations.AddField(
+            model_name='event',
+            name='occurrence_count',
+            field=models.PositiveIntegerField(null=True, blank=True, editable=False, verbose_name='occurrence count'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0005_event_occurrence_bounds'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='occurrence',
+            index_together=set([('event', 'original_start'), ('event', 'start')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('schedule', '0006_occurrence_start_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OccurrenceIndexRange',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField(verbose_name='start')),
+                ('end', models.DateTimeField(verbose_name='end')),
+                ('event', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='occurrence_index_range', to='schedule.Event', verbose_name='event')),
+            ],
+            options={
+                'verbose_name': 'occurrence index range',
+                'verbose_name_plural': 'occurrence index ranges',
+            },
+        ),
+    ]
@@ -188,8 +188,8 @@ class Calendar(with_metaclass(ModelBase, *get_model_bases())):
         """
         return self.events.order_by('-start').filter(start__lt=timezone.now())[:amount]
 
-    def occurrences_after(self, date=None):
-        return EventListManager(self.events.all()).occurrences_after(date)
+    def occurrences_after(self, date=None, until=None, limit=None):
+        return EventListManager(self.events.all()).occurrences_after(date, until, limit)
 
     def get_absolute_url(self):
         if USE_FULLCALENDAR:
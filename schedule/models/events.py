@@ -3,13 +3,16 @@ from django.utils.six import with_metaclass
 # -*- coding: utf-8 -*-
 from django.conf import settings as django_settings
 from dateutil import rrule
+from contextlib import contextmanager
 import datetime
+import threading
+from operator import attrgetter
 import pytz
 
 from django.contrib.contenttypes import fields
-from django.db import models
+from django.db import connections, models, transaction
 from django.db.models.base import ModelBase
-from django.db.models import Q
+from django.db.models import F, Func, Q, Value
 from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import date, time
@@ -22,7 +25,11 @@ from stations.models import Station
 from schedule.models.livestreamUrls import LivestreamUrl
 from schedule.models.rules import Rule
 from schedule.models.calendars import Calendar
-from schedule.utils import OccurrenceReplacer
+from schedule.conf.settings import (OCCURRENCE_INDEX_HORIZON, OCCURRENCE_INDEX_LOOKBACK,
+                                    SIMPLE_RECURRENCE_FAST_PATH, USE_OCCURRENCE_INDEX)
+from schedule.instrumentation import incr, phase
+from schedule.recurrence import SimpleRecurrence
+from schedule.utils import OccurrenceReplacer, rrule_cache
 from schedule.utils import get_model_bases
 
 freq_dict_order = {
@@ -45,8 +52,62 @@ param_dict_order = {
     'bysecond': 6
 }
 
+# Span of original starts whose persisted occurrences Event.occurrences_after
+# loads at a time.
+PERSISTED_OCCURRENCES_WINDOW = datetime.timedelta(days=90)
 
-class EventManager(models.Manager):
+# Event fields the recurrence bounds are computed from, besides the rule's
+# params and the calendar's timezone.
+OCCURRENCE_BOUNDS_INPUTS = ('start', 'end', 'rule_id', 'end_recurring_period', 'calendar_id')
+OCCURRENCE_BOUNDS_FIELDS = ('first_occurrence_start', 'last_occurrence_end', 'occurrence_count')
+
+_loaded_events = threading.local()
+
+
+def _iter_after(rule, dt):
+    """
+    Iterates the occurrences of ``rule`` from ``dt`` on, without building the
+    ones before it where the rule allows that.
+    """
+    if hasattr(rule, 'xafter'):
+        return rule.xafter(dt, inc=True)
+    # dateutil before 2.7
+    return (occurrence for occurrence in rule if occurrence >= dt)
+
+
+def _deferred_fields(instance):
+    # Model.get_deferred_fields is new in Django 1.8
+    if hasattr(instance, 'get_deferred_fields'):
+        return instance.get_deferred_fields()
+    return set()
+
+
+class EventQuerySet(models.QuerySet):
+    def overlapping(self, start, end):
+        """
+        Restricts the events to the ones that can have an occurrence
+        overlapping (start, end): one-off events running during the window,
+        recurring events whose recurrence starts before the window ends and has
+        not ended before it starts, and events with a persisted occurrence
+        moved into the window.
+
+        Events are compared by their precomputed occurrence bounds. Rows saved
+        before those existed fall back to their start, end and
+        end_recurring_period, which excludes a recurring event whose
+        end_recurring_period falls before ``start`` even if its last
+        occurrence is still running at ``start``.
+        """
+        bounded = Q(first_occurrence_start__lt=end) & (
+            Q(last_occurrence_end__gt=start) | Q(occurrence_count__isnull=True))
+        one_off = Q(rule__isnull=True, start__lt=end, end__gt=start)
+        recurring = Q(rule__isnull=False, start__lt=end) & (
+            Q(end_recurring_period__isnull=True) | Q(end_recurring_period__gte=start))
+        not_computed = Q(first_occurrence_start__isnull=True, occurrence_count__isnull=True) & (one_off | recurring)
+        moved = Q(pk__in=Occurrence.objects.filter(start__lt=end, end__gt=start).values('event_id'))
+        return self.filter(bounded | not_computed | moved)
+
+
+class EventManager(models.Manager.from_queryset(EventQuerySet)):
     def get_for_object(self, content_object, distinction=None, inherit=True):
         return EventRelation.objects.get_events_for_object(content_object, distinction, inherit)
 
@@ -89,12 +150,27 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         # default=1,
         verbose_name=_("calendar"))
     # color_event = models.CharField(_("Color event"), null=True, blank=True, max_length=10)
+    # Recurrence bounds, recomputed on save when their inputs changed and on
+    # rule or calendar timezone changes (see update_occurrence_bounds).
+    # occurrence_count is None for events recurring without an end, and all
+    # three are None for rows saved before they existed (see the
+    # backfill_occurrence_bounds command).
+    first_occurrence_start = models.DateTimeField(_("first occurrence start"), null=True, blank=True,
+                                                  editable=False)
+    last_occurrence_end = models.DateTimeField(_("last occurrence end"), null=True, blank=True,
+                                               editable=False)
+    occurrence_count = models.PositiveIntegerField(_("occurrence count"), null=True, blank=True,
+                                                   editable=False)
     objects = EventManager()
 
     class Meta(object):
         verbose_name = _('event')
         verbose_name_plural = _('events')
         app_label = 'schedule'
+        index_together = (
+            ('calendar', 'start'),
+            ('calendar', 'end_recurring_period'),
+        )
 
     def __str__(self):
         return ugettext('%(title)s: %(start)s %(stime)s-%(etime)s') % {
@@ -104,6 +180,144 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             'etime': time(self.end, django_settings.TIME_FORMAT),
         }
 
+    def __init__(self, *args, **kwargs):
+        super(Event, self).__init__(*args, **kwargs)
+        self._bounds_inputs = self._occurrence_bounds_inputs()
+
+    def save(self, *args, **kwargs):
+        # recomputing the bounds walks every occurrence, so only do it when
+        # they are missing or their inputs changed since the event was loaded
+        inputs = self._occurrence_bounds_inputs()
+        # read by the occurrence index's post_save handler
+        self._recurrence_changed = (inputs is None or inputs != self._bounds_inputs or
+                                    not self._has_occurrence_bounds())
+        if self._recurrence_changed:
+            self.update_occurrence_bounds()
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']).union(OCCURRENCE_BOUNDS_FIELDS)
+        super(Event, self).save(*args, **kwargs)
+        self._bounds_inputs = inputs
+
+    def shift(self, delta_start, delta_end):
+        """
+        Moves the event's start and end by ``delta_start`` and ``delta_end``
+        and the original times of its persisted occurrences with them, so the
+        occurrences keep replacing the generated ones they were edited from.
+        Everything is written in one transaction; the event is saved last so
+        its post_save handlers (rrule cache, occurrence index, live-now
+        cache) see the shifted occurrences. If it fails, the event keeps its
+        times in memory too.
+        """
+        start, end = self.start, self.end
+        try:
+            with transaction.atomic():
+                _shift_datetimes(Occurrence.objects.filter(event=self),
+                                 original_start=delta_start, original_end=delta_end)
+                self.start = start + delta_start
+                self.end = end + delta_end
+                self.save()
+        except Exception:
+            self.start, self.end = start, end
+            raise
+
+    def update_occurrences(self, original_starts, cancelled=None, title=None,
+                           delta_start=None, delta_end=None):
+        """
+        Cancels or uncancels (``cancelled``), retitles (``title``) and moves
+        (by ``delta_start`` and ``delta_end``) the occurrences of this event
+        originally starting at ``original_starts``, in one transaction, and
+        returns them persisted.
+
+        The rule is expanded once over the span of ``original_starts`` to
+        check them all; occurrences not persisted yet are created with one
+        bulk insert and persisted ones are changed with bulk updates. Raises
+        ValueError for a start that is not an occurrence of this event.
+        """
+        original_starts = set(original_starts)
+        if not original_starts:
+            return []
+        generated = dict((occurrence.original_start, occurrence) for occurrence in self._get_occurrence_list(
+            min(original_starts), max(original_starts) + datetime.timedelta(microseconds=1)))
+        missing = original_starts - set(generated)
+        if missing:
+            raise ValueError('%s is not an occurrence of %s' % (min(missing), self))
+
+        changes = {}
+        if cancelled is not None:
+            changes['cancelled'] = cancelled
+        if title is not None:
+            changes['title'] = title
+        with transaction.atomic():
+            persisted = Occurrence.objects.filter(event=self, original_start__in=original_starts)
+            existing = set(persisted.values_list('original_start', flat=True))
+            if changes:
+                persisted.update(updated_on=timezone.now(), **changes)
+            _shift_datetimes(persisted, start=delta_start, end=delta_end)
+
+            created = []
+            for original_start in original_starts - existing:
+                occurrence = generated[original_start].to_occurrence()
+                for field, value in changes.items():
+                    setattr(occurrence, field, value)
+                occurrence.start += delta_start or datetime.timedelta(0)
+                occurrence.end += delta_end or datetime.timedelta(0)
+                created.append(occurrence)
+            Occurrence.objects.bulk_create(created)
+            occurrences = list(Occurrence.objects.filter(event=self, original_start__in=original_starts))
+            # bulk writes send no signals, the event's post_save handlers
+            # refresh the caches built from its occurrences
+            if USE_OCCURRENCE_INDEX:
+                OccurrenceIndex.objects.update_for_occurrences(occurrences)
+            self.save(update_fields=['updated_on'])
+        return occurrences
+
+    def update_occurrence_bounds(self):
+        """
+        Sets first_occurrence_start, last_occurrence_end and occurrence_count
+        from the event's times and rule. Events recurring without an
+        end_recurring_period only get their first occurrence.
+        """
+        (self.first_occurrence_start, self.last_occurrence_end,
+         self.occurrence_count) = self._compute_occurrence_bounds()
+
+    def _compute_occurrence_bounds(self):
+        if self.rule is None:
+            return self.start, self.end, 1
+        use_naive = timezone.is_naive(self.start)
+        tzinfo = self.calendar.timezone if self.calendar_id else pytz.utc
+        difference = self.end - self.start
+        first = last = previous = None
+        count = 0
+        # built outside rrule_cache: bounds are recomputed while the rule or
+        # the event is being saved, right after its cache entries were dropped
+        for o_start in self._build_rrule_object(tzinfo):
+            if not use_naive:
+                o_start = pytz.utc.normalize(tzinfo.localize(o_start))
+            if o_start == previous:
+                # wall clock time skipped by a DST change
+                continue
+            previous = o_start
+            if self.end_recurring_period is None:
+                return o_start, None, None
+            # like _occurrences_after_generator, an occurrence starting at
+            # end_recurring_period still counts
+            if o_start > self.end_recurring_period:
+                break
+            if first is None:
+                first = o_start
+            last = o_start + difference
+            count += 1
+        return first, last, count
+
+    def _occurrence_bounds_inputs(self):
+        # reading a deferred field would cost a query
+        if _deferred_fields(self).intersection(OCCURRENCE_BOUNDS_INPUTS):
+            return None
+        return tuple(getattr(self, name) for name in OCCURRENCE_BOUNDS_INPUTS)
+
+    def _has_occurrence_bounds(self):
+        return self.first_occurrence_start is not None or self.occurrence_count is not None
+
     @property
     def seconds(self):
         return (self.end - self.start).total_seconds()
@@ -119,7 +333,7 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
     def get_absolute_url(self):
         return reverse('event', args=[self.id])
 
-    def get_occurrences(self, start, end):
+    def get_occurrences(self, start, end, persisted_occurrences=None):
         """
         >>> rule = Rule(frequency = "MONTHLY", name = "Monthly")
         >>> rule.save()
@@ -136,9 +350,21 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         >>> occurrences = event.get_occurrences(datetime.datetime(2008,1,24), datetime.datetime(2008,3,2))
         >>> ["%s to %s" %(o.start, o.end) for o in occurrences]
         []
-`
+
+        ``persisted_occurrences`` lets a caller that already fetched this event's
+        persisted occurrences (see schedule.engine) skip the per-event query.
+
+        Occurrences are returned in start order.
         """
-        persisted_occurrences = self.occurrence_set.all()
+        with phase('expand'):
+            return self._get_occurrences(start, end, persisted_occurrences)
+
+    def _get_occurrences(self, start, end, persisted_occurrences):
+        incr('events_expanded')
+        if persisted_occurrences is None:
+            with loaded_events({self.pk: self}):
+                persisted_occurrences = list(
+                    self.occurrence_set.in_window(start, end, self.end - self.start))
         occ_replacer = OccurrenceReplacer(persisted_occurrences)
         occurrences = self._get_occurrence_list(start, end)
         final_occurrences = []
@@ -154,9 +380,21 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         # then add persisted occurrences which originated outside of this period but now
         # fall within it
         final_occurrences += occ_replacer.get_additional_occurrences(start, end)
+        # generated occurrences are already in start order, only moved ones can
+        # be out of place
+        final_occurrences.sort(key=attrgetter('start'))
         return final_occurrences
 
     def get_rrule_object(self, tzinfo):
+        if self.rule is None:
+            return None
+        if self.pk is None or self.rule.pk is None:
+            return self._build_rrule_object(tzinfo)
+        key = (self.pk, self.rule.pk, self.rule.frequency, self.rule.params,
+               self.start, self.end_recurring_period, str(tzinfo))
+        return rrule_cache.get(key, lambda: self._build_rrule_object(tzinfo))
+
+    def _build_rrule_object(self, tzinfo):
         if self.rule is not None:
             params, empty = self._event_params()
             frequency = self.rule.rrule_frequency()
@@ -166,6 +404,10 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
                 dtstart = tzinfo.normalize(self.start).replace(tzinfo=None)
 
             if not empty:
+                if SIMPLE_RECURRENCE_FAST_PATH:
+                    recurrence = SimpleRecurrence.build(frequency, dtstart, params)
+                    if recurrence is not None:
+                        return recurrence
                 return rrule.rrule(frequency, dtstart=dtstart, **params)
             else:
                 year = self.start.year - 1
@@ -174,7 +416,7 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
     def _create_occurrence(self, start, end=None):
         if end is None:
             end = start + (self.end - self.start)
-        return Occurrence(event=self, start=start, end=end, original_start=start, original_end=end)
+        return VirtualOccurrence(self, start, end)
 
     def get_occurrence(self, date):
 
@@ -193,7 +435,7 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             try:
                 return Occurrence.objects.get(event=self, original_start=pytz.utc.normalize(date))
             except Occurrence.DoesNotExist:
-                return self._create_occurrence(next_occurrence)
+                return self._create_occurrence(next_occurrence).to_occurrence()
 
     def _get_occurrence_list(self, start, end):
         """
@@ -219,23 +461,22 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
 
             rule = self.get_rrule_object(tzinfo)
 
+            # one window covers the occurrences starting within (start, end)
+            # and the ones that started earlier but are still running at start
+            o_starts = rule.between(start - difference, end)
+            incr('occurrences_generated', len(o_starts))
             occurrences = []
-            o_starts = []
-            o_starts.append(rule.between(start, end)) # occurrences which start within (start,end)
-            o_starts.append(rule.between(start - difference, end - difference)) # occurrences which end within (start,end)
-            if ((end-start) <= difference) : #and (start>=self.start) : # if (start,end) interval is smaller than event interval
-                o_starts.append(rule.between(start-difference, end))
-            for occ in o_starts:
-                for o_start in occ:
-
-                    if not use_naive:
-                        # Localize to calendar timezone, then normalize to utc
-                        o_start = pytz.utc.normalize(tzinfo.localize(o_start))
-
-                    o_end = o_start + difference
-                    occurrence = self._create_occurrence(o_start, o_end)
-                    if occurrence not in occurrences:
-                        occurrences.append(occurrence)
+            seen = set()
+            for o_start in o_starts:
+                if not use_naive:
+                    # Localize to calendar timezone, then normalize to utc
+                    o_start = pytz.utc.normalize(tzinfo.localize(o_start))
+                # wall clock times skipped by a DST change localize to the same
+                # instant as the hour after them
+                if o_start in seen:
+                    continue
+                seen.add(o_start)
+                occurrences.append(self._create_occurrence(o_start, o_start + difference))
             return occurrences
         else:
             # check if event is in the period
@@ -244,36 +485,40 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
             else:
                 return []
 
-    def _occurrences_after_generator(self, after=None):
+    def _occurrences_after_generator(self, after=None, start_from=None):
         """
         returns a generator that produces unpresisted occurrences after the
-        datetime ``after``. (Optionally) This generator will return up to
-        ``max_occurences`` occurrences or has reached ``self.end_recurring_period``, whichever is smallest.
+        datetime ``after``, until ``self.end_recurring_period`` is reached.
+        Occurrences starting before ``start_from`` are skipped. The rule is
+        expanded from there on, not from the event's start.
         """
 
+        # expand in the calendar's timezone, as _get_occurrence_list does
         tzinfo = self.calendar.timezone
         if after is None:
             after = timezone.now()
-        elif not timezone.is_naive(after):
-            tzinfo = after.tzinfo
         rule = self.get_rrule_object(tzinfo)
         if rule is None:
-            if self.end > after:
+            if self.end > after and (start_from is None or self.start >= start_from):
                 yield self._create_occurrence(self.start, self.end)
             return
-        date_iter = iter(rule)
         difference = self.end - self.start
-        loop_counter = 0
+        # nothing starting before this can end after ``after`` or be kept
+        lower = after - difference
+        if start_from is not None and start_from > lower:
+            lower = start_from
+        # a day of slack covers the wall clock shifts of DST changes
+        local_lower = lower.astimezone(tzinfo).replace(tzinfo=None) - datetime.timedelta(days=1)
+        date_iter = _iter_after(rule, local_lower)
         for o_start in date_iter:
+            incr('occurrences_generated')
             o_start = tzinfo.localize(o_start).astimezone(pytz.utc)
             if self.end_recurring_period and o_start > self.end_recurring_period:
                 break
             o_end = o_start + difference
-            if o_end > after:
+            if o_end > after and (start_from is None or o_start >= start_from):
                 yield self._create_occurrence(o_start, o_end)
 
-            loop_counter += 1
-
     def occurrences_after(self, after=None, max_occurences=None):
         """
         returns a generator that produces occurrences after the datetime
@@ -282,12 +527,19 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         """
         if after is None:
             after = timezone.now()
-        occ_replacer = OccurrenceReplacer(self.occurrence_set.all())
+        # persisted occurrences are loaded window by window as the generator
+        # gets to them
+        occ_replacer = OccurrenceReplacer([])
+        loaded_until = after - (self.end - self.start)
         generator = self._occurrences_after_generator(after)
         trickies = list(self.occurrence_set.filter(original_start__lte=after, start__gte=after).order_by('start'))
         for index, nxt in enumerate(generator):
             if max_occurences and index > max_occurences - 1:
                 break
+            if nxt.original_start >= loaded_until:
+                window_start, loaded_until = loaded_until, nxt.original_start + PERSISTED_OCCURRENCES_WINDOW
+                occ_replacer.add(self.occurrence_set.filter(
+                    original_start__gte=window_start, original_start__lt=loaded_until))
             if (len(trickies) > 0 and (nxt is None or nxt.start > trickies[0].start)):
                 yield trickies.pop(0)
             yield occ_replacer.get_occurrence(nxt)
@@ -346,7 +598,9 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
 
     @property
     def effective_start(self):
-        if self.pk and self.end_recurring_period:
+        if self.pk and self.end_recurring_period and self._has_occurrence_bounds():
+            return self.first_occurrence_start
+        elif self.pk and self.end_recurring_period:
             occ_generator = self._occurrences_after_generator(self.start)
             try:
                 return next(occ_generator).start
@@ -358,7 +612,9 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
 
     @property
     def effective_end(self):
-        if self.pk and self.end_recurring_period:
+        if self.pk and self.end_recurring_period and self._has_occurrence_bounds():
+            return self.last_occurrence_end
+        elif self.pk and self.end_recurring_period:
             params, empty = self.event_params
             if empty or not self.effective_start:
                 return None
@@ -373,6 +629,28 @@ class Event(with_metaclass(ModelBase, *get_model_bases())):
         return None
 
 
+def _shift_datetimes(queryset, **deltas):
+    """
+    Adds a timedelta to datetime fields of all rows of ``queryset``, as in
+    ``_shift_datetimes(occurrences, start=delta, end=delta)``, in a single
+    UPDATE.
+    """
+    deltas = dict((field, delta) for field, delta in deltas.items() if delta)
+    if not deltas:
+        return
+    sqlite = connections[queryset.db].vendor == 'sqlite'
+    shifted = {}
+    for field, delta in deltas.items():
+        expression = F(field) + delta
+        if sqlite:
+            # SQLite formats datetime arithmetic with a UTC offset the stored
+            # values lack, which breaks comparisons with them
+            expression = Func(expression, Value('+00:00'), Value(''), function='REPLACE',
+                              output_field=models.DateTimeField())
+        shifted[field] = expression
+    queryset.update(**shifted)
+
+
 class EventRelationManager(models.Manager):
     '''
     >>> import datetime
@@ -527,35 +805,12 @@ class EventRelation(with_metaclass(ModelBase, *get_model_bases())):
 
 
 @python_2_unicode_compatible
-class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
-    event = models.ForeignKey(Event, on_delete=models.CASCADE, verbose_name=_("event"))
-    title = models.CharField(_("title"), max_length=255, blank=True, null=True)
-    description = models.TextField(_("description"), blank=True, null=True)
-    livestreamUrl = models.ForeignKey(LivestreamUrl, blank=True, null=True)
-    image = models.URLField(max_length=1000, null=True, blank=True, help_text=_("Image url to represent the event"))
-    start = models.DateTimeField(_("start"))
-    end = models.DateTimeField(_("end"))
-    cancelled = models.BooleanField(_("cancelled"), default=False)
-    original_start = models.DateTimeField(_("original start"))
-    original_end = models.DateTimeField(_("original end"))
-    created_on = models.DateTimeField(_("created on"), auto_now_add=True)
-    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
-
-    class Meta(object):
-        verbose_name = _("occurrence")
-        verbose_name_plural = _("occurrences")
-        app_label = 'schedule'
-
-    def __init__(self, *args, **kwargs):
-        super(Occurrence, self).__init__(*args, **kwargs)
-        if self.title is None and self.event_id:
-            self.title = self.event.title
-        if self.description is None and self.event_id:
-            self.description = self.event.description
-        if self.livestreamUrl is None and self.event_id:
-            self.livestreamUrl = self.event.livestreamUrl
-        if self.image is None and self.event_id and self.event.image:
-            self.image = self.event.image
+class OccurrenceMixin(object):
+    """
+    Behaviour shared by persisted occurrences and the VirtualOccurrence values
+    generated from an event's rule.
+    """
+    __slots__ = ()
 
     def moved(self):
         return self.original_start != self.start or self.original_end != self.end
@@ -641,6 +896,314 @@ class Occurrence(with_metaclass(ModelBase, *get_model_bases())):
         return self.end < other.end
 
     def __eq__(self, other):
-        return (isinstance(other, Occurrence) and
+        return (isinstance(other, OccurrenceMixin) and
                 self.original_start == other.original_start and
                 self.original_end == other.original_end)
+
+    def __ne__(self, other):
+        return not self == other
+
+    # a persisted occurrence hashes like the generated one it replaces;
+    # occurrences of different events compare equal by their times, but the
+    # event id keeps them apart in sets such as the deletion collector's
+    def __hash__(self):
+        return hash((self.event_id, self.original_start, self.original_end))
+
+
+class OccurrenceQuerySet(models.QuerySet):
+    def in_window(self, start, end, duration):
+        """
+        Restricts the occurrences to the ones that can show up when events
+        lasting ``duration`` are expanded between ``start`` and ``end``: those
+        replacing a generated occurrence of the window, found by original start
+        on the (event, original_start) index, and those moved into the window.
+        """
+        replacing = Q(original_start__gte=start - duration, original_start__lte=end)
+        moved = Q(start__lt=end, end__gt=start)
+        return self.filter(replacing | moved)
+
+
+OccurrenceManager = models.Manager.from_queryset(OccurrenceQuerySet)
+
+
+@contextmanager
+def loaded_events(events_by_id):
+    """
+    Occurrences instantiated inside this block take their event from
+    ``events_by_id`` (a dict of events by pk) when it holds it, instead of
+    querying it to fill in their defaults.
+    """
+    previous = getattr(_loaded_events, 'events', None)
+    _loaded_events.events = events_by_id
+    try:
+        yield
+    finally:
+        _loaded_events.events = previous
+
+
+class Occurrence(with_metaclass(ModelBase, *([OccurrenceMixin] + get_model_bases()))):
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, verbose_name=_("event"))
+    title = models.CharField(_("title"), max_length=255, blank=True, null=True)
+    description = models.TextField(_("description"), blank=True, null=True)
+    livestreamUrl = models.ForeignKey(LivestreamUrl, blank=True, null=True)
+    image = models.URLField(max_length=1000, null=True, blank=True, help_text=_("Image url to represent the event"))
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+    cancelled = models.BooleanField(_("cancelled"), default=False)
+    original_start = models.DateTimeField(_("original start"))
+    original_end = models.DateTimeField(_("original end"))
+    created_on = models.DateTimeField(_("created on"), auto_now_add=True)
+    updated_on = models.DateTimeField(_("updated on"), auto_now=True)
+
+    objects = OccurrenceManager()
+
+    class Meta(object):
+        verbose_name = _("occurrence")
+        verbose_name_plural = _("occurrences")
+        app_label = 'schedule'
+        index_together = (
+            ('event', 'original_start'),
+            ('event', 'start'),
+        )
+
+    def __init__(self, *args, **kwargs):
+        super(Occurrence, self).__init__(*args, **kwargs)
+        events_by_id = getattr(_loaded_events, 'events', None)
+        if events_by_id and self.event_id in events_by_id:
+            self.event = events_by_id[self.event_id]
+        elif not self.event_id:
+            # an unsaved event passed in is attached without an id
+            if getattr(self, Occurrence.event.field.get_cache_name(), None) is None:
+                return
+        # deferred fields would each cost a query to check
+        deferred = _deferred_fields(self)
+        if 'title' not in deferred and self.title is None:
+            self.title = self.event.title
+        if 'description' not in deferred and self.description is None:
+            self.description = self.event.description
+        if 'livestreamUrl_id' not in deferred and self.livestreamUrl_id is None:
+            self.livestreamUrl = self.event.livestreamUrl
+        if 'image' not in deferred and self.image is None and self.event.image:
+            self.image = self.event.image
+
+
+class VirtualOccurrence(OccurrenceMixin):
+    """
+    An occurrence generated from an event's rule that has not been persisted.
+
+    Expansion creates one of these per occurrence instead of an Occurrence
+    model instance: they only hold the event and the times, and read the
+    title, description, livestream url and image from the event. Saving,
+    moving or cancelling one promotes it to a real Occurrence (see
+    ``to_occurrence``), after which it reports that occurrence's pk.
+    """
+    __slots__ = ('event_id', 'start', 'end', 'original_start', 'original_end', 'cancelled',
+                 '_event', '_persisted')
+
+    def __init__(self, event, start, end, original_start=None, original_end=None, cancelled=False):
+        self._event = event
+        self.event_id = event.pk
+        self.start = start
+        self.end = end
+        self.original_start = start if original_start is None else original_start
+        self.original_end = end if original_end is None else original_end
+        self.cancelled = cancelled
+        self._persisted = None
+
+    @property
+    def event(self):
+        if self._event is None:
+            self._event = Event.objects.get(pk=self.event_id)
+        return self._event
+
+    @property
+    def pk(self):
+        return self._persisted.pk if self._persisted is not None else None
+
+    id = pk
+
+    @property
+    def title(self):
+        return self.event.title
+
+    @property
+    def description(self):
+        return self.event.description
+
+    @property
+    def livestreamUrl(self):
+        return self.event.livestreamUrl
+
+    @property
+    def livestreamUrl_id(self):
+        return self.event.livestreamUrl_id
+
+    @property
+    def image(self):
+        return self.event.image
+
+    @property
+    def created_on(self):
+        return self._persisted.created_on if self._persisted is not None else None
+
+    @property
+    def updated_on(self):
+        return self._persisted.updated_on if self._persisted is not None else None
+
+    def __repr__(self):
+        return '<VirtualOccurrence: %s>' % self
+
+    def to_occurrence(self):
+        """
+        Returns the Occurrence model instance for this occurrence, unsaved
+        unless it was saved through this object before, carrying its current
+        times and cancelled flag.
+        """
+        if self._persisted is None:
+            self._persisted = Occurrence(event=self.event)
+        occurrence = self._persisted
+        occurrence.start = self.start
+        occurrence.end = self.end
+        occurrence.original_start = self.original_start
+        occurrence.original_end = self.original_end
+        occurrence.cancelled = self.cancelled
+        return occurrence
+
+    def save(self):
+        self.to_occurrence().save()
+
+
+class OccurrenceIndexManager(models.Manager):
+
+    def covers(self, start, end, events=None):
+        """
+        Whether the index can answer a window query from ``start`` to ``end``
+        for ``events`` (a list or queryset, all events by default): every one
+        of them was last indexed over a range containing the window. Events
+        never indexed, or whose range ran out because rebuild_occurrence_index
+        stopped rolling it forward, make the window fall back to expansion.
+        """
+        if events is None:
+            events = Event.objects.all()
+        elif not isinstance(events, models.QuerySet):
+            events = Event.objects.filter(pk__in=[event.pk for event in events])
+        return not events.exclude(
+            occurrence_index_range__start__lte=start, occurrence_index_range__end__gte=end).exists()
+
+    def rebuild_for_event(self, event):
+        """
+        Replace the index rows of ``event`` with its occurrences (persisted
+        ones included) from ``OCCURRENCE_INDEX_LOOKBACK`` before now up to
+        the horizon, and record that range as the event's coverage.
+        """
+        self.filter(event=event).delete()
+        if event.pk is None:
+            return []
+        now = timezone.now()
+        start = now - OCCURRENCE_INDEX_LOOKBACK
+        end = max(now + OCCURRENCE_INDEX_HORIZON, event.end)
+        rows = [self._row(occ) for occ in event.get_occurrences(start, end)]
+        self.bulk_create(rows)
+        OccurrenceIndexRange.objects.update_or_create(event=event, defaults={'start': start, 'end': end})
+        return rows
+
+    def update_for_occurrences(self, occurrences):
+        """
+        Replaces the index rows of the persisted ``occurrences`` (of a single
+        event), and of the generated occurrences they stand in for, leaving
+        the event's other rows alone.
+        """
+        occurrences = list(occurrences)
+        if not occurrences:
+            return
+        self.filter(event_id=occurrences[0].event_id,
+                    original_start__in=[occ.original_start for occ in occurrences]).delete()
+        self.bulk_create([self._row(occ) for occ in occurrences])
+
+    def restore_generated(self, occurrence):
+        """
+        Replaces the index row of the deleted persisted ``occurrence`` with
+        the generated occurrence it stood in for, if its event still has one
+        at that time.
+        """
+        self.filter(event_id=occurrence.event_id, original_start=occurrence.original_start).delete()
+        event = Event.objects.filter(pk=occurrence.event_id).first()
+        if event is None:
+            return
+        around = datetime.timedelta(microseconds=1)
+        self.bulk_create([
+            self._row(occ) for occ in event._get_occurrence_list(
+                occurrence.original_start - around, occurrence.original_start + around)
+            if occ.original_start == occurrence.original_start])
+
+    def _row(self, occurrence):
+        return OccurrenceIndex(
+            event_id=occurrence.event_id,
+            occurrence_id=occurrence.pk,
+            utc_start=occurrence.start,
+            utc_end=occurrence.end,
+            original_start=occurrence.original_start,
+            cancelled=occurrence.cancelled)
+
+    def window(self, start, end, events=None):
+        """
+        Returns the index rows overlapping (start, end) ordered by event and
+        then start, the order expansion yields them in, optionally restricted
+        to ``events`` (a list or queryset).
+        """
+        rows = self.filter(utc_start__lt=end, utc_end__gt=start)
+        if events is not None:
+            rows = rows.filter(event__in=events)
+        return rows.select_related(
+            'event', 'event__calendar', 'event__rule', 'event__livestreamUrl',
+            'occurrence').order_by('event_id', 'utc_start', 'original_start')
+
+    def occurrences_in_window(self, start, end, events=None):
+        return [row.get_occurrence() for row in self.window(start, end, events)]
+
+
+class OccurrenceIndex(with_metaclass(ModelBase, *get_model_bases())):
+    """
+    A materialized occurrence of an event, maintained on Event, Occurrence
+    and Rule writes (see schedule.signals) when USE_OCCURRENCE_INDEX is set,
+    so window queries are a single range scan instead of an rrule expansion
+    per event.
+    """
+    event = models.ForeignKey(Event, on_delete=models.CASCADE, verbose_name=_("event"))
+    occurrence = models.ForeignKey(Occurrence, on_delete=models.CASCADE, null=True, blank=True,
+                                   verbose_name=_("occurrence"))
+    utc_start = models.DateTimeField(_("start"), db_index=True)
+    utc_end = models.DateTimeField(_("end"))
+    original_start = models.DateTimeField(_("original start"))
+    cancelled = models.BooleanField(_("cancelled"), default=False)
+
+    objects = OccurrenceIndexManager()
+
+    class Meta(object):
+        verbose_name = _("occurrence index")
+        verbose_name_plural = _("occurrence index")
+        app_label = 'schedule'
+
+    def get_occurrence(self):
+        if self.occurrence_id is not None:
+            occurrence = self.occurrence
+            occurrence.event = self.event
+            return occurrence
+        return self.event._create_occurrence(self.utc_start, self.utc_end)
+
+
+class OccurrenceIndexRange(with_metaclass(ModelBase, *get_model_bases())):
+    """
+    The range an event's OccurrenceIndex rows were last built over. Window
+    queries outside it are answered by expansion (see
+    ``OccurrenceIndexManager.covers``).
+    """
+    event = models.OneToOneField(Event, on_delete=models.CASCADE, related_name='occurrence_index_range',
+                                 verbose_name=_("event"))
+    start = models.DateTimeField(_("start"))
+    end = models.DateTimeField(_("end"))
+
+    class Meta(object):
+        verbose_name = _("occurrence index range")
+        verbose_name_plural = _("occurrence index ranges")
+        app_label = 'schedule'
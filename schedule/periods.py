@@ -1,16 +1,20 @@
 from __future__ import unicode_literals
 from django.utils.six.moves.builtins import range
+import bisect
 import pytz
 import datetime
 import calendar as standardlib_calendar
+from operator import attrgetter
 
 from django.conf import settings
 from django.utils.translation import ugettext
 from django.utils.encoding import python_2_unicode_compatible
 from django.template.defaultfilters import date as date_filter
 from django.utils.dates import WEEKDAYS, WEEKDAYS_ABBR
-from schedule.conf.settings import SHOW_CANCELLED_OCCURRENCES
-from schedule.models import Occurrence
+from schedule.conf.settings import SHOW_CANCELLED_OCCURRENCES, USE_OCCURRENCE_INDEX
+from schedule.models import EventQuerySet, Occurrence, OccurrenceIndex
+from schedule.engine import occurrences_for_events
+from schedule.instrumentation import phase
 from django.utils import timezone
 
 weekday_names = []
@@ -30,6 +34,41 @@ else:
         weekday_abbrs.append(WEEKDAYS_ABBR[i])
 
 
+class OccurrencePool(object):
+    """
+    The occurrences of an outermost period, computed once and shared with its
+    sub-periods and the neighbouring periods it covers. They are kept sorted by
+    start so a period's occurrences are sliced with bisect instead of
+    filtering the whole pool.
+
+    A pool built from a plain list (the way ``occurrence_pool`` used to be
+    passed) does not know which span it covers and is only handed down to
+    sub-periods.
+    """
+    def __init__(self, occurrences, utc_start=None, utc_end=None):
+        self.occurrences = sorted(occurrences, key=attrgetter('start'))
+        self.starts = [occurrence.start for occurrence in self.occurrences]
+        # how far before a period's start an overlapping occurrence may begin
+        self.max_duration = max([occurrence.end - occurrence.start for occurrence in self.occurrences] or
+                                [datetime.timedelta(0)])
+        self.utc_start = utc_start
+        self.utc_end = utc_end
+
+    def covers(self, utc_start, utc_end):
+        return (self.utc_start is not None and
+                self.utc_start <= utc_start and utc_end <= self.utc_end)
+
+    def between(self, utc_start, utc_end):
+        """
+        The occurrences overlapping (utc_start, utc_end), sorted like
+        ``Period.occurrences``.
+        """
+        low = bisect.bisect_left(self.starts, utc_start - self.max_duration)
+        high = bisect.bisect_right(self.starts, utc_end)
+        return sorted(occurrence for occurrence in self.occurrences[low:high]
+                      if occurrence.end >= utc_start)
+
+
 class Period(object):
     """
     This class represents a period of time. It can return a set of occurrences
@@ -44,6 +83,8 @@ class Period(object):
 
         self.events = events
         self.tzinfo = self._get_tzinfo(tzinfo)
+        if occurrence_pool is not None and not isinstance(occurrence_pool, OccurrencePool):
+            occurrence_pool = OccurrencePool(occurrence_pool)
         self.occurrence_pool = occurrence_pool
         if parent_persisted_occurrences is not None:
             self._persisted_occurrences = parent_persisted_occurrences
@@ -71,15 +112,18 @@ class Period(object):
         return tzinfo if settings.USE_TZ else None
 
     def _get_sorted_occurrences(self):
-        occurrences = []
-        if hasattr(self, "occurrence_pool") and self.occurrence_pool is not None:
-            for occurrence in self.occurrence_pool:
-                if occurrence.start <= self.utc_end and occurrence.end >= self.utc_start:
-                    occurrences.append(occurrence)
-            return occurrences
-        for event in self.events:
-            event_occurrences = event.get_occurrences(self.start, self.end)
-            occurrences += event_occurrences
+        if getattr(self, 'occurrence_pool', None) is not None:
+            return self.occurrence_pool.between(self.utc_start, self.utc_end)
+        if (USE_OCCURRENCE_INDEX and
+                OccurrenceIndex.objects.covers(self.utc_start, self.utc_end, self.events)):
+            with phase('index'):
+                return sorted(OccurrenceIndex.objects.occurrences_in_window(
+                    self.utc_start, self.utc_end, self.events))
+        events = self.events
+        if isinstance(events, EventQuerySet):
+            # skip events that cannot reach this period before expanding them
+            events = events.overlapping(self.utc_start, self.utc_end)
+        occurrences = occurrences_for_events(events, self.start, self.end)
         return sorted(occurrences)
 
     def cached_get_sorted_occurrences(self):
@@ -90,8 +134,17 @@ class Period(object):
         return occs
     occurrences = property(cached_get_sorted_occurrences)
 
+    def get_occurrence_pool(self):
+        """
+        The pool handed to sub-periods: the one this period was created with,
+        or one built from this period's own occurrences.
+        """
+        if getattr(self, 'occurrence_pool', None) is None:
+            self.occurrence_pool = OccurrencePool(self.occurrences, self.utc_start, self.utc_end)
+        return self.occurrence_pool
+
     def get_persisted_occurrences(self):
-        if hasattr(self, '_persisted_occurrenes'):
+        if hasattr(self, '_persisted_occurrences'):
             return self._persisted_occurrences
         else:
             self._persisted_occurrences = Occurrence.objects.filter(event__in=self.events)
@@ -120,10 +173,11 @@ class Period(object):
 
     def get_occurrence_partials(self):
         occurrence_dicts = []
-        for occurrence in self.occurrences:
-            occurrence = self.classify_occurrence(occurrence)
-            if occurrence:
-                occurrence_dicts.append(occurrence)
+        with phase('partials'):
+            for occurrence in self.occurrences:
+                occurrence = self.classify_occurrence(occurrence)
+                if occurrence:
+                    occurrence_dicts.append(occurrence)
         return occurrence_dicts
 
     def get_occurrences(self):
@@ -141,15 +195,30 @@ class Period(object):
         if tzinfo is None:
             tzinfo = self.tzinfo
         start = start or self.start
-        return cls(self.events, start, self.get_persisted_occurrences(), self.occurrences, tzinfo)
+        return cls(self.events, start, self.get_persisted_occurrences(), self.get_occurrence_pool(), tzinfo)
 
     def get_periods(self, cls, tzinfo=None):
         if tzinfo is None:
             tzinfo = self.tzinfo
-        period = self.create_sub_period(cls)
+        period = self.create_sub_period(cls, tzinfo=tzinfo)
         while period.start < self.end:
-            yield self.create_sub_period(cls, period.start, tzinfo)
-            period = next(period)
+            yield period
+            period = self.create_sub_period(cls, period.end, tzinfo)
+
+    def create_neighbour_period(self, cls, date):
+        """
+        Returns the ``cls`` period around ``date`` (the next or previous one,
+        or an enclosing one), slicing this period's occurrence pool when it
+        covers the new period instead of expanding the events again.
+        """
+        period = cls(self.events, date, tzinfo=self.tzinfo)
+        pool = getattr(self, 'occurrence_pool', None)
+        if pool is None and hasattr(self, '_occurrences'):
+            pool = self.get_occurrence_pool()
+        if pool is not None and pool.covers(period.utc_start, period.utc_end):
+            period.occurrence_pool = pool
+            period._persisted_occurrences = self.get_persisted_occurrences()
+        return period
 
     @property
     def start(self):
@@ -177,12 +246,12 @@ class Year(Period):
         return self.get_periods(Month)
 
     def next_year(self):
-        return Year(self.events, self.end, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, self.end)
     next = __next__ = next_year
 
     def prev_year(self):
         start = datetime.datetime(self.start.year - 1, self.start.month, self.start.day)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, start)
     prev = prev_year
 
     def _get_year_range(self, year):
@@ -232,24 +301,24 @@ class Month(Period):
         return self.create_sub_period(Day, date)
 
     def next_month(self):
-        return Month(self.events, self.end, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Month, self.end)
     next = __next__ = next_month
 
     def prev_month(self):
         start = (self.start - datetime.timedelta(days=1)).replace(day=1, tzinfo=self.tzinfo)
-        return Month(self.events, start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Month, start)
     prev = prev_month
 
     def current_year(self):
-        return Year(self.events, self.start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, self.start)
 
     def prev_year(self):
         start = datetime.datetime.min.replace(year=self.start.year - 1, tzinfo=self.tzinfo)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, start)
 
     def next_year(self):
         start = datetime.datetime.min.replace(year=self.start.year + 1, tzinfo=self.tzinfo)
-        return Year(self.events, start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, start)
 
     def _get_month_range(self, month):
         year = month.year
@@ -296,18 +365,18 @@ class Week(Period):
                                    parent_persisted_occurrences, occurrence_pool, tzinfo=tzinfo)
 
     def prev_week(self):
-        return Week(self.events, self.start - datetime.timedelta(days=7), tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Week, self.start - datetime.timedelta(days=7))
     prev = prev_week
 
     def next_week(self):
-        return Week(self.events, self.end, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Week, self.end)
     next = __next__ = next_week
 
     def current_month(self):
-        return Month(self.events, self.start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Month, self.start)
 
     def current_year(self):
-        return Year(self.events, self.start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, self.start)
 
     def get_days(self):
         return self.get_periods(Day)
@@ -390,18 +459,18 @@ class Day(Period):
         }
 
     def prev_day(self):
-        return Day(self.events, self.start - datetime.timedelta(days=1), tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Day, self.start - datetime.timedelta(days=1))
     prev = prev_day
 
     def next_day(self):
-        return Day(self.events, self.end, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Day, self.end)
     next = __next__ = next_day
 
     def current_year(self):
-        return Year(self.events, self.start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Year, self.start)
 
     def current_month(self):
-        return Month(self.events, self.start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Month, self.start)
 
     def current_week(self):
-        return Week(self.events, self.start, tzinfo=self.tzinfo)
+        return self.create_neighbour_period(Week, self.start)
@@ -0,0 +1,134 @@
+"""
+Arithmetic expansion of simple recurrence rules.
+
+dateutil's rrule answers ``between`` and ``after`` by iterating every
+occurrence from ``dtstart`` onwards, so the cost of a window grows with the age
+of the event. Most rules are plain HOURLY, DAILY or WEEKLY ones, optionally
+with an ``interval``, a ``count`` or (for HOURLY and DAILY) a ``byweekday``
+filter. Their occurrences are ``dtstart + k * step``, so the ones in a window
+can be computed directly from integer offsets.
+
+Like the rrules built by ``Event.get_rrule_object``, these work on naive
+wall-clock datetimes in the calendar's timezone; localization (and therefore
+DST handling) is left to the caller exactly as before.
+"""
+import datetime
+
+from dateutil import rrule
+
+STEPS = {
+    rrule.HOURLY: datetime.timedelta(hours=1),
+    rrule.DAILY: datetime.timedelta(days=1),
+    rrule.WEEKLY: datetime.timedelta(weeks=1),
+}
+
+# params equal to the matching dtstart attribute do not change the expansion
+NOOP_PARAMS = {
+    'byhour': 'hour',
+    'byminute': 'minute',
+    'bysecond': 'second',
+}
+
+
+def _as_list(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+
+def _microseconds(delta):
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class SimpleRecurrence(object):
+    """
+    A drop-in replacement for the ``between``, ``after``, ``xafter`` and
+    iteration API of ``dateutil.rrule.rrule`` for the rules accepted by
+    ``build``.
+    """
+
+    def __init__(self, dtstart, step, count=None, weekdays=None):
+        self.dtstart = dtstart
+        self.step = step
+        self.count = count
+        self.weekdays = weekdays
+        self._step_us = _microseconds(step)
+
+    @classmethod
+    def build(cls, frequency, dtstart, params):
+        """
+        Returns a SimpleRecurrence equivalent to
+        ``rrule.rrule(frequency, dtstart=dtstart, **params)``, or None when the
+        rule needs dateutil (other frequencies or params such as bysetpos,
+        bymonthday or byeaster).
+        """
+        if frequency not in STEPS or dtstart.microsecond:
+            return None
+        interval = 1
+        count = None
+        weekdays = None
+        for param, value in params.items():
+            if param == 'interval':
+                interval = value
+            elif param == 'count':
+                count = value
+            elif param == 'byweekday':
+                weekdays = frozenset(_as_list(value))
+            elif param in NOOP_PARAMS:
+                if _as_list(value) != [getattr(dtstart, NOOP_PARAMS[param])]:
+                    return None
+            else:
+                return None
+        if not isinstance(interval, int) or interval < 1:
+            return None
+        if weekdays is not None:
+            if not weekdays or not all(isinstance(day, int) and 0 <= day <= 6 for day in weekdays):
+                return None
+            if frequency == rrule.WEEKLY:
+                # a weekly step never leaves dtstart's weekday; more days would
+                # mean several occurrences per week
+                if weekdays != frozenset([dtstart.weekday()]):
+                    return None
+                weekdays = None
+            elif count is not None:
+                # count applies to the filtered occurrences
+                return None
+        return cls(dtstart, STEPS[frequency] * interval, count, weekdays)
+
+    def _first_index(self, dt, inc):
+        """
+        The smallest k for which dtstart + k * step is after ``dt``.
+        """
+        offset = _microseconds(dt - self.dtstart)
+        if offset < 0:
+            return 0
+        index, remainder = divmod(offset, self._step_us)
+        if remainder or not inc:
+            index += 1
+        return index
+
+    def _occurrences(self, first, last=None):
+        index = first
+        while (last is None or index < last) and (self.count is None or index < self.count):
+            try:
+                occurrence = self.dtstart + self.step * index
+            except OverflowError:
+                return
+            if self.weekdays is None or occurrence.weekday() in self.weekdays:
+                yield occurrence
+            index += 1
+
+    def between(self, after, before, inc=False):
+        last = self._first_index(before, not inc)
+        return list(self._occurrences(self._first_index(after, inc), last))
+
+    def after(self, dt, inc=False):
+        for occurrence in self._occurrences(self._first_index(dt, inc)):
+            return occurrence
+        return None
+
+    def xafter(self, dt, inc=False):
+        return self._occurrences(self._first_index(dt, inc))
+
+    def __iter__(self):
+        return self._occurrences(0)
@@ -1,6 +1,13 @@
-from django.db.models.signals import pre_save
+import threading
 
-from schedule.models import Event, Calendar
+from django.db.models.signals import pre_save, post_save, pre_delete, post_delete
+
+from schedule import livenow
+from schedule.conf.settings import USE_OCCURRENCE_INDEX
+from schedule.models import Event, Calendar, Occurrence, OccurrenceIndex, Rule
+from schedule.utils import rrule_cache
+
+_deletions = threading.local()
 
 
 def optional_calendar(sender, **kwargs):
@@ -19,3 +26,134 @@ def optional_calendar(sender, **kwargs):
     return True
 
 pre_save.connect(optional_calendar)
+
+
+def invalidate_rrule_cache(sender, **kwargs):
+    instance = kwargs['instance']
+    if isinstance(instance, Event):
+        rrule_cache.invalidate(event_id=instance.pk)
+    else:
+        rrule_cache.invalidate(rule_id=instance.pk)
+
+post_save.connect(invalidate_rrule_cache, sender=Event)
+post_save.connect(invalidate_rrule_cache, sender=Rule)
+post_delete.connect(invalidate_rrule_cache, sender=Event)
+post_delete.connect(invalidate_rrule_cache, sender=Rule)
+
+
+def update_occurrence_bounds(sender, **kwargs):
+    """
+    A rule change moves the occurrences of every event using it, and so does
+    a change of a calendar's timezone for its recurring events.
+    """
+    instance = kwargs['instance']
+    if isinstance(instance, Rule):
+        events = instance.event_set.select_related('calendar')
+    elif getattr(instance, '_timezone_changed', False):
+        events = instance.event_set.filter(rule__isnull=False).select_related('rule')
+    else:
+        return
+    for event in events:
+        if isinstance(instance, Calendar):
+            event.calendar = instance
+        event.update_occurrence_bounds()
+        Event.objects.filter(pk=event.pk).update(
+            first_occurrence_start=event.first_occurrence_start,
+            last_occurrence_end=event.last_occurrence_end,
+            occurrence_count=event.occurrence_count)
+
+
+def check_timezone_change(sender, **kwargs):
+    calendar = kwargs['instance']
+    previous = Calendar.objects.filter(pk=calendar.pk).values_list('timezone', flat=True).first()
+    calendar._timezone_changed = previous is not None and str(previous) != str(calendar.timezone)
+
+post_save.connect(update_occurrence_bounds, sender=Rule)
+pre_save.connect(check_timezone_change, sender=Calendar)
+post_save.connect(update_occurrence_bounds, sender=Calendar)
+
+
+def update_occurrence_index(sender, **kwargs):
+    """
+    Keeps the OccurrenceIndex rows of the affected events in step with
+    Event, Occurrence, Rule and Calendar timezone writes. A saved occurrence
+    only replaces its own row; events are rebuilt when their recurrence
+    changed.
+    """
+    if not USE_OCCURRENCE_INDEX:
+        return
+    instance = kwargs['instance']
+    if isinstance(instance, Occurrence):
+        OccurrenceIndex.objects.update_for_occurrences([instance])
+        return
+    if isinstance(instance, Event):
+        events = [instance] if getattr(instance, '_recurrence_changed', True) else []
+    elif isinstance(instance, Rule):
+        events = instance.event_set.all()
+    elif getattr(instance, '_timezone_changed', False):
+        events = instance.event_set.filter(rule__isnull=False)
+    else:
+        events = []
+    for event in events:
+        OccurrenceIndex.objects.rebuild_for_event(event)
+
+
+def occurrence_deleted(sender, **kwargs):
+    """
+    A deleted occurrence puts its generated counterpart back in the index,
+    unless it is going away as part of a cascade from its event, which must
+    not get new rows.
+    """
+    if not USE_OCCURRENCE_INDEX:
+        return
+    occurrence = kwargs['instance']
+    if occurrence.event_id not in _events_being_deleted():
+        OccurrenceIndex.objects.restore_generated(occurrence)
+
+
+def _events_being_deleted():
+    if not hasattr(_deletions, 'event_ids'):
+        _deletions.event_ids = set()
+    return _deletions.event_ids
+
+
+def event_deleting(sender, **kwargs):
+    # pre_delete is sent for the event before its occurrences are deleted
+    _events_being_deleted().add(kwargs['instance'].pk)
+
+
+def event_deleted(sender, **kwargs):
+    _events_being_deleted().discard(kwargs['instance'].pk)
+
+post_save.connect(update_occurrence_index, sender=Event)
+post_save.connect(update_occurrence_index, sender=Occurrence)
+post_save.connect(update_occurrence_index, sender=Rule)
+post_save.connect(update_occurrence_index, sender=Calendar)
+post_delete.connect(occurrence_deleted, sender=Occurrence)
+pre_delete.connect(event_deleting, sender=Event)
+post_delete.connect(event_deleted, sender=Event)
+
+
+def invalidate_live_now(sender, **kwargs):
+    """
+    Drops the cached /api/livenow responses of the calendars a write touches.
+    """
+    instance = kwargs['instance']
+    if isinstance(instance, Calendar):
+        slugs = [instance.slug]
+    elif isinstance(instance, Event):
+        slugs = Calendar.objects.filter(pk=instance.calendar_id).values_list('slug', flat=True)
+    elif isinstance(instance, Occurrence):
+        slugs = Calendar.objects.filter(event__pk=instance.event_id).values_list('slug', flat=True)
+    else:
+        slugs = Calendar.objects.filter(event__rule=instance).values_list('slug', flat=True).distinct()
+    livenow.invalidate(list(slugs))
+
+post_save.connect(invalidate_live_now, sender=Calendar)
+post_save.connect(invalidate_live_now, sender=Event)
+post_save.connect(invalidate_live_now, sender=Occurrence)
+post_save.connect(invalidate_live_now, sender=Rule)
+post_delete.connect(invalidate_live_now, sender=Calendar)
+post_delete.connect(invalidate_live_now, sender=Event)
+post_delete.connect(invalidate_live_now, sender=Occurrence)
+post_delete.connect(invalidate_live_now, sender=Rule)
@@ -11,8 +11,9 @@ from django.utils.safestring import mark_safe
 from django.utils.six.moves.urllib.parse import urlencode
 
 from schedule.conf.settings import CHECK_EVENT_PERM_FUNC, CHECK_CALENDAR_PERM_FUNC, SCHEDULER_PREVNEXT_LIMIT_SECONDS
+from schedule.instrumentation import phase
 from schedule.models import Calendar
-from schedule.periods import weekday_names, weekday_abbrs, Period
+from schedule.periods import weekday_names, weekday_abbrs, OccurrencePool, Period
 
 register = template.Library()
 
@@ -61,10 +62,15 @@ def daily_table(context, day, start=0, end=24, increment=30):
     context['addable'] = addable
 
     day_part = Period(day.events, day.start + datetime.timedelta(hours=start),
-        day.start + datetime.timedelta(hours=end))
+        day.start + datetime.timedelta(hours=end), day.get_persisted_occurrences())
+    # reuse the occurrences of the day (or of the week it belongs to)
+    pool = day.get_occurrence_pool()
+    if pool.covers(day_part.utc_start, day_part.utc_end):
+        day_part.occurrence_pool = pool
 
     # get slots to display on the left
-    slots = _cook_slots(day_part, increment)
+    with phase('daily_table'):
+        slots = _cook_slots(day_part, increment)
     context['slots'] = slots
     return context
 
@@ -264,15 +270,29 @@ def _cook_slots(period, increment):
         Arguments:
         period - time period for the whole series
         increment - slot size in minutes
+
+        The period's occurrences are computed once and swept over the slot
+        boundaries in start order; every slot gets the occurrences overlapping
+        it as its pool instead of expanding the events again.
     """
     tdiff = datetime.timedelta(minutes=increment)
     num = int((period.end - period.start).total_seconds()) // int(tdiff.total_seconds())
+    pending = sorted(period.occurrences, key=lambda occ: occ.start)
+    persisted_occurrences = period.get_persisted_occurrences()
+    active = []
+    index = 0
     s = period.start
     slots = []
     for i in range(num):
-        sl = period.get_time_slot(s, s + tdiff)
+        e = s + tdiff
+        while index < len(pending) and pending[index].start < e:
+            active.append(pending[index])
+            index += 1
+        # slots are swept in order, so occurrences ending by now are done
+        active = [occ for occ in active if occ.end > s]
+        sl = Period(period.events, s, e, persisted_occurrences, OccurrencePool(active))
         slots.append(sl)
-        s = s + tdiff
+        s = e
     return slots
 
 
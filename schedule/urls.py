@@ -9,7 +9,8 @@ from schedule.views import (
     OccurrenceView, EditOccurrenceView, DeleteEventView,
     EditEventView, CreateEventView, OccurrencePreview,
     CreateOccurrenceView, CancelOccurrenceView, FullCalendarView,
-    api_select_create, api_move_or_resize_by_code, api_occurrences, live_now)
+    api_select_create, api_move_or_resize_by_code, api_bulk_update_occurrences,
+    api_occurrences, live_now)
 
 urlpatterns = [
     # urls for Calendars
@@ -102,6 +103,9 @@ urlpatterns = [
     url(r'^api/move_or_resize/$',
         api_move_or_resize_by_code,
         name='api_move_or_resize'),
+    url(r'^api/bulk_update_occurrences/$',
+        api_bulk_update_occurrences,
+        name='api_bulk_update_occurrences'),
     url(r'^api/select_create/$',
         api_select_create,
         name='api_select_create'),
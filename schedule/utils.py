@@ -1,15 +1,24 @@
+from collections import OrderedDict
 from functools import wraps
-import heapq
+from operator import itemgetter
+import bisect
+import datetime
+import threading
 from annoying.functions import get_object_or_None
+from django.core.serializers.json import DjangoJSONEncoder
 from django.http import HttpResponseRedirect, HttpResponseNotFound
 from django.conf import settings
-from django.utils import timezone
+from django.utils.http import parse_http_date_safe
 from django.utils.module_loading import import_string
 from schedule.conf.settings import (
     CHECK_EVENT_PERM_FUNC,
     CHECK_CALENDAR_PERM_FUNC,
     CHECK_OCCURRENCE_PERM_FUNC,
-    CALENDAR_VIEW_PERM)
+    CALENDAR_VIEW_PERM,
+    RRULE_CACHE_SIZE)
+from schedule.instrumentation import incr
+
+EPOCH = datetime.datetime(1970, 1, 1)
 
 
 class EventListManager(object):
@@ -22,39 +31,31 @@ class EventListManager(object):
     def __init__(self, events):
         self.events = events
 
-    def occurrences_after(self, after=None):
+    def occurrences_after(self, after=None, until=None, limit=None):
         """
         It is often useful to know what the next occurrence is given a list of
         events.  This function produces a generator that yields the
         the most recent occurrence after the date ``after`` from any of the
-        events in ``self.events``
+        events in ``self.events``, optionally stopping before ``until`` or
+        after ``limit`` occurrences.
         """
-        from schedule.models import Occurrence
+        from schedule.engine import iter_occurrences_after
 
-        if after is None:
-            after = timezone.now()
-        occ_replacer = OccurrenceReplacer(
-            Occurrence.objects.filter(event__in=self.events))
-        generators = [event._occurrences_after_generator(after) for event in self.events]
-        occurrences = []
+        return iter_occurrences_after(self.events, after, until, limit)
 
-        for generator in generators:
-            try:
-                heapq.heappush(occurrences, (next(generator), generator))
-            except StopIteration:
-                pass
 
-        while True:
-            if len(occurrences) == 0:
-                raise StopIteration
+def _epoch(dt):
+    """
+    Microseconds since the epoch of ``dt``; naive datetimes are taken as UTC.
+    """
+    if dt.tzinfo is not None:
+        dt = dt.replace(tzinfo=None) - dt.utcoffset()
+    delta = dt - EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
 
-            generator = occurrences[0][1]
 
-            try:
-                next_occurence = heapq.heapreplace(occurrences, (next(generator), generator))[0]
-            except StopIteration:
-                next_occurence = heapq.heappop(occurrences)[0]
-            yield occ_replacer.get_occurrence(next_occurence)
+def _occurrence_key(event_id, original_start, original_end):
+    return (event_id, _epoch(original_start), _epoch(original_end))
 
 
 class OccurrenceReplacer(object):
@@ -63,36 +64,166 @@ class OccurrenceReplacer(object):
     before passing it forward is to make sure all of the occurrences that
     have been stored in the datebase replace, in the list you are returning,
     the generated ones that are equivalent.  This class makes this easier.
+
+    Persisted occurrences are keyed on (event id, original start, original
+    end), so they can belong to any number of events and never need their
+    event loaded. Besides Occurrence instances, the replacer accepts
+    ``values_list('event_id', 'original_start', 'original_end')`` rows, which
+    are enough to tell which generated occurrences have been persisted (see
+    ``has_occurrence`` and ``drop``) but have nothing to replace them with.
     """
 
-    def __init__(self, persisted_occurrences):
-        lookup = [((occ.event, occ.original_start, occ.original_end), occ) for
-                  occ in persisted_occurrences]
-        self.lookup = dict(lookup)
+    def __init__(self, persisted_occurrences=()):
+        self.lookup = {}
+        # keys of the persisted occurrences added as values_list rows
+        self.keys = set()
+        # persisted instances sorted by start epoch, for range queries
+        self._by_start = []
+        self._starts = []
+        self._longest = 0
+        self.add(persisted_occurrences)
+
+    def add(self, persisted_occurrences):
+        """
+        Adds more persisted occurrences, so a replacer can be filled window by
+        window as the occurrences it replaces are generated.
+        """
+        added = []
+        for occ in persisted_occurrences:
+            if isinstance(occ, tuple):
+                self.keys.add(_occurrence_key(*occ[:3]))
+                continue
+            self.lookup[_occurrence_key(occ.event_id, occ.original_start, occ.original_end)] = occ
+            start = _epoch(occ.start)
+            self._longest = max(self._longest, _epoch(occ.end) - start)
+            added.append((start, occ))
+        added.sort(key=itemgetter(0))
+        if added and self._starts and added[0][0] < self._starts[-1]:
+            # only batches reaching back before the last start are inserted
+            # one by one, windows filled in order are simply appended
+            for start, occ in added:
+                index = bisect.bisect_right(self._starts, start)
+                self._starts.insert(index, start)
+                self._by_start.insert(index, (start, occ))
+        else:
+            self._starts.extend(start for start, _ in added)
+            self._by_start.extend(added)
 
     def get_occurrence(self, occ):
         """
         Return a persisted occurrences matching the occ and remove it from lookup since it
-        has already been matched
+        has already been matched. ``occ`` itself is returned when there is none,
+        or when only the key of its persisted occurrence was added.
         """
-        return self.lookup.pop(
-            (occ.event, occ.original_start, occ.original_end),
-            occ)
+        persisted = self.lookup.pop(_occurrence_key(occ.event_id, occ.original_start, occ.original_end), None)
+        if persisted is None:
+            return occ
+        incr('replacer_matches')
+        return persisted
+
+    def get_occurrences(self, occurrences):
+        """
+        Batch version of ``get_occurrence`` for occurrences of any number of
+        events.
+        """
+        return [self.get_occurrence(occ) for occ in occurrences]
 
     def has_occurrence(self, occ):
-        try:
-            return (occ.event, occ.original_start, occ.original_end) in self.lookup
-        except TypeError:
-            if not self.lookup:
+        key = _occurrence_key(occ.event_id, occ.original_start, occ.original_end)
+        return key in self.lookup or key in self.keys
+
+    def drop(self, occ):
+        """
+        Removes the persisted occurrence matching ``occ``, returning whether
+        there was one.
+        """
+        key = _occurrence_key(occ.event_id, occ.original_start, occ.original_end)
+        if self.lookup.pop(key, None) is None:
+            if key not in self.keys:
                 return False
-            else:
-                raise TypeError('A problem with checking if a persisted occurence exists has occured!')
+            self.keys.remove(key)
+        incr('replacer_matches')
+        return True
 
     def get_additional_occurrences(self, start, end):
         """
         Return persisted occurrences which are now in the period
         """
-        return [occ for _, occ in list(self.lookup.items()) if (occ.start < end and occ.end > start and not occ.cancelled)]
+        start, end = _epoch(start), _epoch(end)
+        # only occurrences starting less than the longest duration before
+        # ``start`` can still be running at ``start``
+        low = bisect.bisect_right(self._starts, start - self._longest)
+        high = bisect.bisect_left(self._starts, end)
+        return [occ for _, occ in self._by_start[low:high]
+                if _epoch(occ.end) > start and not occ.cancelled and self._is_unmatched(occ)]
+
+    def _is_unmatched(self, occ):
+        return self.lookup.get(_occurrence_key(occ.event_id, occ.original_start, occ.original_end)) is occ
+
+
+class RRuleCache(object):
+    """
+    A process-wide LRU cache of compiled ``dateutil.rrule.rrule`` objects.
+    Parsing rule params and building an rrule for every event on every request
+    dominates the cost of polling endpoints, so ``Event.get_rrule_object`` keeps
+    them here keyed by everything the rrule depends on. Entries are dropped
+    when their event or rule is saved or deleted (see schedule.signals).
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, factory):
+        """
+        Return the rrule cached under ``key``, building it with ``factory``
+        on a miss.
+        """
+        if not self.maxsize:
+            return factory()
+        with self._lock:
+            try:
+                value = self._entries.pop(key)
+            except KeyError:
+                self.misses += 1
+            else:
+                self._entries[key] = value
+                self.hits += 1
+                return value
+        value = factory()
+        with self._lock:
+            self._entries[key] = value
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, event_id=None, rule_id=None):
+        """
+        Drop the entries of an event and/or of every event using a rule.
+        Keys start with (event_id, rule_id).
+        """
+        with self._lock:
+            for key in list(self._entries):
+                if key[0] == event_id or (rule_id is not None and key[1] == rule_id):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+            'maxsize': self.maxsize,
+        }
+
+rrule_cache = RRuleCache(RRULE_CACHE_SIZE)
 
 
 def get_occurrence(request, *args, **kwargs):
@@ -227,6 +358,46 @@ def calendar_view_permissions(function):
         return function(request, *args, **kwargs)
     return decorator
 
+def is_not_modified(request, etag, last_modified):
+    """
+    Whether a conditional GET can be answered with a 304, given the current
+    ``etag`` (quoted) and ``last_modified`` (a unix timestamp) of the resource.
+    If-None-Match takes precedence over If-Modified-Since.
+    """
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        etags = [tag.strip() for tag in if_none_match.split(',')]
+        return etag in etags or '*' in etags
+    if_modified_since = request.META.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None:
+        since = parse_http_date_safe(if_modified_since)
+        return since is not None and last_modified <= since
+    return False
+
+
+def iter_json_array(items, chunk_size=8192):
+    """
+    Encodes the iterable ``items`` as a JSON array piece by piece, producing
+    exactly the bytes ``JsonResponse(list(items), safe=False)`` would, in
+    chunks of roughly ``chunk_size`` characters.
+    """
+    encoder = DjangoJSONEncoder()
+    chunk = ['[']
+    size = 1
+    for index, item in enumerate(items):
+        if index:
+            chunk.append(', ')
+        encoded = encoder.encode(item)
+        chunk.append(encoded)
+        size += len(encoded) + 2
+        if size >= chunk_size:
+            yield ''.join(chunk)
+            chunk = []
+            size = 0
+    chunk.append(']')
+    yield ''.join(chunk)
+
+
 def coerce_date_dict(date_dict):
     """
     given a dictionary (presumed to be from request.GET) it returns a tuple
@@ -1,11 +1,19 @@
 import pytz
 import datetime
+from collections import OrderedDict, defaultdict
+from operator import attrgetter
+import hashlib
+import itertools
+import json
 import dateutil.parser
 from django.utils.six.moves.urllib.parse import quote
 
 from django.db.models import Q, F
+from django.core import signing
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseNotModified, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 from django.http import HttpResponseRedirect, Http404, HttpResponseBadRequest
@@ -15,25 +23,34 @@ from django.views.generic.detail import DetailView
 from django.views.generic.list import ListView
 from django.views.generic.edit import (
     UpdateView, CreateView, DeleteView, ModelFormMixin, ProcessFormView)
-from django.utils.http import is_safe_url
+from django.utils.http import http_date, is_safe_url
 from django.conf import settings
 
 from schedule.conf.settings import (GET_EVENTS_FUNC, OCCURRENCE_CANCEL_REDIRECT,
                                     EVENT_NAME_PLACEHOLDER, CHECK_EVENT_PERM_FUNC,
-                                    CHECK_OCCURRENCE_PERM_FUNC, USE_FULLCALENDAR)
+                                    CHECK_OCCURRENCE_PERM_FUNC, USE_FULLCALENDAR,
+                                    USE_OCCURRENCE_INDEX, LIVENOW_CACHE_MAX_AGE,
+                                    STREAM_OCCURRENCES_API, OCCURRENCES_API_MAX_LIMIT)
+from schedule import livenow
+from schedule.engine import iter_occurrences_after, iter_occurrences_for_events, occurrence_key
+from schedule.instrumentation import phase
 from schedule.forms import EventForm, OccurrenceForm
-from schedule.models import Calendar, Occurrence, Event
+from schedule.models import Calendar, Occurrence, Event, OccurrenceIndex
 from schedule.periods import weekday_names
 from schedule.utils import (
     check_event_permissions,
     check_calendar_permissions,
     coerce_date_dict,
     check_occurrence_permissions,
-    calendar_view_permissions)
+    calendar_view_permissions,
+    is_not_modified,
+    iter_json_array)
 from schedule.templatetags.scheduletags import querystring_for_date
 
 from stations.models import Station
 
+OCCURRENCES_CURSOR_SALT = 'schedule.views.api_occurrences'
+
 class CalendarListView(ListView):
     template_name = 'schedule/calendar_list.html'
 
@@ -253,22 +270,15 @@ class EditEventView(EventEditMixin, UpdateView):
     def form_valid(self, form):
         event = form.save(commit=False)
         old_event = Event.objects.get(pk=event.pk)
-        dts = datetime.timedelta(
-            minutes=int((event.start - old_event.start).total_seconds() / 60)
-        )
-        dte = datetime.timedelta(
-            minutes=int((event.end - old_event.end).total_seconds() / 60)
-        )
-        # event.occurrence_set.all().update(
-        #     original_start=F('original_start') + dts,
-        #     original_end=F('original_end') + dte,
-        # )
-        for occ in event.occurrence_set.all():
-            occ.original_start = occ.original_start + dts
-            occ.original_end = occ.original_end + dte
-
-        event.save()
-        return super(EditEventView, self).form_valid(form)
+        dts = event.start - old_event.start
+        dte = event.end - old_event.end
+        # shift from the stored times so persisted occurrences move along
+        event.start, event.end = old_event.start, old_event.end
+        # shift() saves the event, so don't save the form a second time
+        event.shift(dts, dte)
+        form.save_m2m()
+        self.object = event
+        return HttpResponseRedirect(self.get_success_url())
 
     def post(self, request, *args, **kwargs):
         event = Event.objects.get(pk=self.kwargs['event_id'])
@@ -398,15 +408,53 @@ def live_now(request):
     shift = request.GET.get('shift')
     utc_now = datetime.datetime.utcnow()
     start = utc_now.replace(tzinfo=pytz.UTC)
-    if shift:
-        start = start + datetime.timedelta(seconds=int(shift))
-    end = start + datetime.timedelta(seconds=10)
-
     try:
-        response_data = _api_occurrences(start, end, calendar_slug)
+        # shifted polls look at arbitrary times, only "now" is worth caching
+        if shift:
+            start = start + datetime.timedelta(seconds=int(shift))
+            payload = _live_now_payload(start, calendar_slug)
+        else:
+            payload = livenow.get_or_compute(
+                calendar_slug, start, lambda: _live_now_payload(start, calendar_slug))
     except (ValueError, Calendar.DoesNotExist) as e:
         return HttpResponseBadRequest(e)
-    return JsonResponse(response_data, safe=False)
+
+    if is_not_modified(request, payload['etag'], payload['last_modified']):
+        return HttpResponseNotModified()
+    response = HttpResponse(payload['content'], content_type='application/json')
+    response['ETag'] = payload['etag']
+    response['Last-Modified'] = http_date(payload['last_modified'])
+    return response
+
+
+def _live_now_payload(now, calendar_slug):
+    """
+    Builds the live-now response at ``now`` along with the time it stays
+    valid until: the next end of a live occurrence or the next start entering
+    the live window, capped at LIVENOW_CACHE_MAX_AGE. Its last_modified is
+    ``now``, which livenow.get_or_compute replaces with the previous
+    payload's when the content did not change.
+    """
+    window_end = now + livenow.LIVENOW_WINDOW
+    expires = now + datetime.timedelta(seconds=LIVENOW_CACHE_MAX_AGE)
+    occurrences = _occurrences_in_window(
+        now, expires + livenow.LIVENOW_WINDOW, _get_calendars(calendar_slug))
+    response_data = []
+    for occurrence in occurrences:
+        if occurrence.cancelled:
+            continue
+        if occurrence.start < window_end and occurrence.end > now:
+            response_data.append(_serialize_occurrence(occurrence))
+            expires = min(expires, occurrence.end)
+        elif occurrence.start >= window_end:
+            expires = min(expires, occurrence.start - livenow.LIVENOW_WINDOW)
+    content = json.dumps(response_data, cls=DjangoJSONEncoder).encode('utf-8')
+    return {
+        'content': content,
+        'etag': '"%s"' % hashlib.md5(content).hexdigest(),
+        'last_modified': _timestamp(now),
+        'expires': expires,
+    }
 
 def api_occurrences(request):
     start = request.GET.get('start')
@@ -431,74 +479,210 @@ def api_occurrences(request):
         utc = pytz.UTC
         start = utc.localize(start)
         end = utc.localize(end)
+    stream = get_boolean_from_request(request, 'stream',
+        default=STREAM_OCCURRENCES_API)
+    try:
+        fields = _get_fields(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(e)
+
+    limit = request.GET.get('limit')
+    if limit is not None:
+        try:
+            response_data = _api_occurrences_page(start, end, calendar_slug,
+                int(limit), request.GET.get('cursor'), include_cancelled=include_cancelled,
+                fields=fields)
+        except (ValueError, signing.BadSignature, Calendar.DoesNotExist) as e:
+            return HttpResponseBadRequest(e)
+        return JsonResponse(response_data)
+
+    if stream:
+        try:
+            response_data = _iter_api_occurrences(start, end, calendar_slug,
+                include_cancelled=include_cancelled, fields=fields)
+        except (ValueError, Calendar.DoesNotExist) as e:
+            return HttpResponseBadRequest(e)
+        return StreamingHttpResponse(iter_json_array(response_data),
+            content_type='application/json')
+
     try:
         response_data = _api_occurrences(start, end, calendar_slug,
-            include_cancelled=include_cancelled)
+            include_cancelled=include_cancelled, fields=fields)
     except (ValueError, Calendar.DoesNotExist) as e:
         return HttpResponseBadRequest(e)
 
     return JsonResponse(response_data, safe=False)
 
-def _api_occurrences(start, end, calendar_slug, include_cancelled=False):
+def _api_occurrences(start, end, calendar_slug, include_cancelled=False, fields=None):
+    return list(_iter_api_occurrences(start, end, calendar_slug, include_cancelled, fields))
+
+
+def _api_occurrences_page(start, end, calendar_slug, limit, cursor=None, include_cancelled=False,
+                          fields=None):
+    """
+    Returns up to ``limit`` serialized occurrences of the window ordered by
+    (start, event id, original start), following the one ``cursor`` points
+    at, along with the cursor of the next page (None on the last page).
+    Pages are read from engine.iter_occurrences_after, which resumes at the
+    cursor without expanding the occurrences of earlier pages. ``limit`` is
+    capped at OCCURRENCES_API_MAX_LIMIT, and a cursor is only accepted for the
+    window and calendar it was issued for.
+    """
     if not start or not end:
         raise ValueError('Start and end parameters are required')
+    if limit < 1:
+        raise ValueError('limit must be positive')
+    limit = min(limit, OCCURRENCES_API_MAX_LIMIT)
+    query = [start.isoformat(), end.isoformat(), calendar_slug]
+    resume_after = _load_cursor(cursor, query) if cursor else None
+    events, occurrences = _projected_querysets(
+        Event.objects.filter(calendar__in=_get_calendars(calendar_slug)).overlapping(start, end), fields)
+    occurrences = iter_occurrences_after(events, start, end, resume_after=resume_after,
+                                         occurrences=occurrences)
+    if not include_cancelled:
+        occurrences = (occurrence for occurrence in occurrences if not occurrence.cancelled)
+    page = list(itertools.islice(occurrences, limit + 1))
+    next_cursor = None
+    if len(page) > limit:
+        page = page[:limit]
+        next_cursor = _dump_cursor(occurrence_key(page[-1]), query)
+    return {
+        'occurrences': [_serialize_occurrence(occurrence, fields) for occurrence in page],
+        'next_cursor': next_cursor,
+    }
+
+
+def _dump_cursor(key, query):
+    start, event_id, original_start = key
+    return signing.dumps([start.isoformat(), event_id, original_start.isoformat()] + query,
+                         salt=OCCURRENCES_CURSOR_SALT)
+
+
+def _load_cursor(cursor, query):
+    values = signing.loads(cursor, salt=OCCURRENCES_CURSOR_SALT)
+    if values[3:] != query:
+        raise ValueError('cursor was issued for another start, end or calendar_slug')
+    start, event_id, original_start = values[:3]
+    return (dateutil.parser.parse(start).astimezone(pytz.utc), event_id,
+            dateutil.parser.parse(original_start).astimezone(pytz.utc))
+
+
+def _iter_api_occurrences(start, end, calendar_slug, include_cancelled=False, fields=None):
+    """
+    Returns a generator of serialized occurrences, limited to ``fields`` when
+    given. Arguments are validated and calendars looked up eagerly so errors
+    surface before streaming starts.
+    """
+    if not start or not end:
+        raise ValueError('Start and end parameters are required')
+    calendars = _get_calendars(calendar_slug)
+
+    def serialize():
+        for occurrence in _occurrences_in_window(start, end, calendars, fields):
+            if occurrence.cancelled and not include_cancelled:
+                continue
+            yield _serialize_occurrence(occurrence, fields)
+    return serialize()
 
+
+def _get_calendars(calendar_slug):
     if calendar_slug:
         # will raise DoesNotExist exception if no match
-        calendars = [Calendar.objects.get(slug=calendar_slug)]
+        return [Calendar.objects.get(slug=calendar_slug)]
     # if no calendar slug is given, get all the calendars
-    else:
-        calendars = Calendar.objects.all()
-    response_data = []
+    return Calendar.objects.all()
+
+
+def _occurrences_in_window(start, end, calendars, fields=None):
+    events = Event.objects.filter(calendar__in=calendars)
+    if USE_OCCURRENCE_INDEX and OccurrenceIndex.objects.covers(start, end, events):
+        with phase('index'):
+            return OccurrenceIndex.objects.occurrences_in_window(start, end, events)
+    # ordered like the index rows
+    events, occurrences = _projected_querysets(
+        events.overlapping(start, end).order_by('pk'), fields)
+    return iter_occurrences_for_events(events, start, end, occurrences)
+
+
+def _occurrence_id(occurrence):
+    if occurrence.id:
+        return str(occurrence.id)
+    return "%d_%d" % (occurrence.event_id, _timestamp(occurrence.start))
+
+
+def _recur_period_end(occurrence):
+    if occurrence.event.end_recurring_period:
+        return occurrence.event.end_recurring_period.isoformat()
+    return None
+
+
+# The fields of a serialized occurrence, in output order, and how to get them.
+OCCURRENCE_FIELDS = OrderedDict((
+    ("id", _occurrence_id),
+    ("title", attrgetter('title')),
+    ("start", lambda occurrence: occurrence.start.isoformat()),
+    ("end", lambda occurrence: occurrence.end.isoformat()),
+    ("start_ts", lambda occurrence: _timestamp(occurrence.start)),
+    ("end_ts", lambda occurrence: _timestamp(occurrence.end)),
+    ("existed", lambda occurrence: bool(occurrence.id)),
+    ("event_id", attrgetter('event_id')),
+    ("description", attrgetter('description')),
+    ("image", attrgetter('image')),
+    ("page_url", attrgetter('livestreamUrl.page_url')),
+    ("stream_url", attrgetter('livestreamUrl.stream_url')),
+    ("rule", lambda occurrence: occurrence.event.rule.name if occurrence.event.rule else None),
+    ("end_recurring_period", _recur_period_end),
+    ("creator_id", lambda occurrence: str(occurrence.event.creator_id)),
+    ("calendar", attrgetter('event.calendar.slug')),
+    ("cancelled", attrgetter('cancelled')),
+    ("timezone", attrgetter('event.calendar.timezone.zone')),
+))
+
+# Event and Occurrence columns that only some fields read, so projected
+# requests can defer them (or skip their join).
+DEFERRABLE_COLUMNS = (
+    ('description', ('description',)),
+    ('image', ('image',)),
+    ('livestreamUrl', ('page_url', 'stream_url')),
+)
+
+
+def _serialize_occurrence(occurrence, fields=None):
+    if fields is None:
+        fields = OCCURRENCE_FIELDS
+    return dict((field, OCCURRENCE_FIELDS[field](occurrence)) for field in fields)
+
+
+def _get_fields(request):
+    """
+    The fields requested with ``fields=id,title,...``, or None for all of
+    them.
+    """
+    fields = [field.strip() for field in request.GET.get('fields', '').split(',') if field.strip()]
+    if not fields:
+        return None
+    unknown = [field for field in fields if field not in OCCURRENCE_FIELDS]
+    if unknown:
+        raise ValueError('Unknown fields: %s' % ', '.join(unknown))
+    return fields
 
-    event_list = []
-    for calendar in calendars:
-        # create flat list of events from each calendar
-        event_list += calendar.events.filter(start__lte=end).filter(
-            Q(end_recurring_period__gte=start) |
-            Q(end_recurring_period__isnull=True))
-    for event in event_list:
-        occurrences = event.get_occurrences(start, end)
-        for occurrence in occurrences:
-            if occurrence.cancelled and not include_cancelled:
-                continue
-            start_ts = _timestamp(occurrence.start)
-            end_ts = _timestamp(occurrence.end)
-            occurrence_id = "%d_%d" %(occurrence.event.id, start_ts)
-            existed = False
-
-            if occurrence.id:
-                occurrence_id = occurrence.id
-                existed = True
-
-            recur_rule = occurrence.event.rule.name \
-                if occurrence.event.rule else None
-            recur_period_end = \
-                occurrence.event.end_recurring_period.isoformat() \
-                if occurrence.event.end_recurring_period else None
-
-            response_data.append({
-                "id": str(occurrence_id),
-                "title": occurrence.title,
-                "start": occurrence.start.isoformat(),
-                "end": occurrence.end.isoformat(),
-                "start_ts": start_ts,
-                "end_ts": end_ts,
-                "existed": existed,
-                "event_id": occurrence.event.id,
-                "description": occurrence.description,
-                "image": occurrence.image,
-                "page_url": occurrence.livestreamUrl.page_url,
-                "stream_url": occurrence.livestreamUrl.stream_url,
-                "rule": recur_rule,
-                "end_recurring_period": recur_period_end,
-                "creator_id": str(occurrence.event.creator_id),
-                "calendar": occurrence.event.calendar.slug,
-                "cancelled": occurrence.cancelled,
-                "timezone": occurrence.event.calendar.timezone.zone,
-            })
-    return response_data
 
+def _projected_querysets(events, fields):
+    """
+    Returns ``events`` and the Occurrence queryset to expand them with,
+    deferring the columns ``fields`` do not need and only joining the
+    livestream urls when they do.
+    """
+    if fields is None:
+        return events, None
+    deferred = [column for column, needed_by in DEFERRABLE_COLUMNS
+                if not set(needed_by) & set(fields)]
+    # prepare_events joins the relations whose column is not deferred
+    events = events.defer(*deferred)
+    occurrences = Occurrence.objects.defer(*deferred)
+    if 'livestreamUrl' not in deferred:
+        occurrences = occurrences.select_related('livestreamUrl')
+    return events, occurrences
 
 
 @require_POST
@@ -537,26 +721,89 @@ def _api_move_or_resize_by_code(user, id, existed, delta, resize, event_id):
             response_data['status'] = "OK"
     else:
         event = Event.objects.get(id=event_id)
-        dts = 0
-        dte = delta
-        if not resize:
-            event.start += delta
-            dts = delta
-        event.end = event.end + delta
         if CHECK_EVENT_PERM_FUNC(event, user):
-            event.save()
-            # event.occurrence_set.all().update(
-            #     original_start=F('original_start') + dts,
-            #     original_end=F('original_end') + dte,
-            # )
-            for occ in event.occurrence_set.all():
-                occ.original_start = occ.original_start + dts
-                occ.original_end = occ.original_end + dte
-
+            event.shift(datetime.timedelta(0) if resize else delta, delta)
             response_data['status'] = "OK"
     return response_data
 
 
+@require_POST
+@check_calendar_permissions
+def api_bulk_update_occurrences(request):
+    """
+    Applies one change to many occurrences. The request body is a JSON object
+    with a list of ``occurrences``, each either ``{"id": ...}`` for a
+    persisted occurrence or ``{"event_id": ..., "original_start": ...}``,
+    and any of ``cancelled`` (a boolean), ``title``, ``delta`` (minutes) and
+    ``resize`` (only move the end), as in api_move_or_resize_by_code. The
+    ``calendar_slug`` query parameter names the calendar checked by
+    check_calendar_permissions; every event is checked on its own as well.
+    """
+    try:
+        data = json.loads(request.body.decode('utf-8'))
+        if not isinstance(data, dict):
+            raise ValueError('Expected a JSON object')
+        identifiers = data['occurrences']
+        if not isinstance(identifiers, list) or not all(isinstance(i, dict) for i in identifiers):
+            raise ValueError('occurrences must be a list of objects')
+        delta = data.get('delta')
+        if delta is not None:
+            delta = datetime.timedelta(minutes=int(delta))
+        response_data = _api_bulk_update_occurrences(
+            request.user, identifiers, data.get('cancelled'), data.get('title'),
+            delta, bool(data.get('resize', False)))
+    except (ValueError, KeyError, TypeError, Event.DoesNotExist, Occurrence.DoesNotExist) as e:
+        return HttpResponseBadRequest(e)
+    return JsonResponse(response_data)
+
+
+def _api_bulk_update_occurrences(user, identifiers, cancelled, title, delta, resize):
+    response_data = {}
+    response_data['status'] = "PERMISSION DENIED"
+
+    persisted_ids = set(int(identifier['id']) for identifier in identifiers if 'id' in identifier)
+    rows = list(Occurrence.objects.filter(
+        pk__in=persisted_ids).values_list('event_id', 'original_start'))
+    if len(rows) != len(persisted_ids):
+        raise Occurrence.DoesNotExist('Unknown occurrence id')
+    original_starts = defaultdict(set)
+    for event_id, original_start in rows:
+        original_starts[event_id].add(original_start)
+    for identifier in identifiers:
+        if 'id' not in identifier:
+            original_start = dateutil.parser.parse(identifier['original_start'])
+            # expansion normalizes with pytz, which rejects dateutil's tzinfos
+            if timezone.is_aware(original_start):
+                original_start = original_start.astimezone(pytz.utc)
+            elif settings.USE_TZ:
+                original_start = pytz.utc.localize(original_start)
+            original_starts[int(identifier['event_id'])].add(original_start)
+
+    events = Event.objects.select_related('rule', 'calendar').in_bulk(list(original_starts))
+    if len(events) != len(original_starts):
+        raise Event.DoesNotExist('Unknown event id')
+    if not all(CHECK_EVENT_PERM_FUNC(event, user) for event in events.values()):
+        return response_data
+
+    delta_start = None if resize else delta
+    occurrences = []
+    with transaction.atomic():
+        for event_id, starts in original_starts.items():
+            occurrences += events[event_id].update_occurrences(
+                starts, cancelled=cancelled, title=title, delta_start=delta_start, delta_end=delta)
+    response_data['status'] = "OK"
+    response_data['occurrences'] = [{
+        'id': occurrence.pk,
+        'event_id': occurrence.event_id,
+        'original_start': occurrence.original_start.isoformat(),
+        'start': occurrence.start.isoformat(),
+        'end': occurrence.end.isoformat(),
+        'cancelled': occurrence.cancelled,
+        'title': occurrence.title,
+    } for occurrence in occurrences]
+    return response_data
+
+
 @require_POST
 @check_calendar_permissions
 def api_select_create(request):
@@ -12,6 +12,7 @@ setup(
     url='https://github.com/llazzaro/django-scheduler',
     packages=[
         'schedule',
+        'schedule.benchmarks',
         'schedule.conf',
         'schedule.feeds',
         'schedule.management',
@@ -0,0 +1,21 @@
+from django.test import TestCase
+
+from schedule.benchmarks.runner import measure, run
+from schedule.models import Calendar
+
+
+class TestBenchmarkRunner(TestCase):
+    def test_measure_counts_queries_and_results(self):
+        Calendar.objects.create(name="MyCal")
+
+        def count_calendars():
+            return len(list(Calendar.objects.all()))
+
+        result = measure(count_calendars, repeat=2)
+        self.assertEqual(result['queries'], 1)
+        self.assertEqual(result['result_count'], 1)
+        self.assertIsNotNone(result['seconds'])
+
+    def test_run_passes_context_to_scenarios(self):
+        results = run([('double', lambda context: lambda: context * 2)], 21)
+        self.assertEqual(results['double']['result_count'], 42)
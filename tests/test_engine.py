@@ -0,0 +1,120 @@
+import datetime
+from unittest import skipIf
+
+import pytz
+
+from django.test import TestCase
+
+from schedule import engine, instrumentation
+from schedule.engine import futures
+from schedule.engine import iter_occurrences_after, occurrence_key, occurrences_for_events
+from schedule.models import Event, Rule, Calendar
+
+
+class TestOccurrencesForEvents(TestCase):
+    def setUp(self):
+        rule = Rule.objects.create(frequency="DAILY")
+        cal = Calendar.objects.create(name="MyCal")
+        for hour in range(5):
+            Event.objects.create(**{
+                'title': 'Show %d' % hour,
+                'start': datetime.datetime(2008, 1, 5, hour, 0, tzinfo=pytz.utc),
+                'end': datetime.datetime(2008, 1, 5, hour, 30, tzinfo=pytz.utc),
+                'end_recurring_period': datetime.datetime(2008, 5, 5, 0, 0, tzinfo=pytz.utc),
+                'rule': rule,
+                'calendar': cal
+            })
+        self.start = datetime.datetime(2008, 1, 12, 0, 0, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 1, 14, 0, 0, tzinfo=pytz.utc)
+        # persist an occurrence for every event
+        for event in Event.objects.all():
+            event.get_occurrences(self.start, self.end)[0].save()
+
+    def test_matches_per_event_expansion(self):
+        expected = []
+        for event in Event.objects.all():
+            expected += event.get_occurrences(self.start, self.end)
+        occurrences = occurrences_for_events(Event.objects.all(), self.start, self.end)
+        self.assertEqual([(o.event_id, o.start, o.pk) for o in occurrences],
+                         [(o.event_id, o.start, o.pk) for o in expected])
+
+    def test_constant_number_of_queries(self):
+        # one query for the events (with rule, calendar and livestreamUrl
+        # joined) and one for all of their persisted occurrences
+        with self.assertNumQueries(2):
+            occurrences = occurrences_for_events(Event.objects.all(), self.start, self.end)
+            for occurrence in occurrences:
+                occurrence.event.calendar.timezone
+                occurrence.event.rule
+                occurrence.livestreamUrl
+        self.assertEqual(len(occurrences), 10)
+
+    def test_own_joins_are_merged(self):
+        # joining only the calendar still leaves rule and livestreamUrl joined
+        with self.assertNumQueries(2):
+            occurrences = occurrences_for_events(
+                Event.objects.select_related('calendar'), self.start, self.end)
+            for occurrence in occurrences:
+                occurrence.event.rule
+                occurrence.event.livestreamUrl
+        self.assertEqual(len(occurrences), 10)
+
+    def test_parallel_expansion_matches_serial(self):
+        other = Calendar.objects.create(name="Other")
+        Event.objects.filter(title__in=['Show 3', 'Show 4']).update(calendar=other)
+        expected = occurrences_for_events(Event.objects.all(), self.start, self.end)
+        settings = (engine.PARALLEL_EXPANSION, engine.PARALLEL_EXPANSION_THRESHOLD)
+        for mode in ('thread', 'process'):
+            engine.PARALLEL_EXPANSION, engine.PARALLEL_EXPANSION_THRESHOLD = mode, 1
+            try:
+                stats = instrumentation.start()
+                occurrences = occurrences_for_events(Event.objects.all(), self.start, self.end)
+            finally:
+                instrumentation.stop()
+                engine.shutdown_executor()
+                engine.PARALLEL_EXPANSION, engine.PARALLEL_EXPANSION_THRESHOLD = settings
+            self.assertEqual([(o.event_id, o.start, o.pk) for o in occurrences],
+                             [(o.event_id, o.start, o.pk) for o in expected])
+            self.assertEqual(stats.counters['events_expanded'], 5)
+            self.assertEqual(stats.counters['replacer_matches'], 5)
+
+    @skipIf(futures is None, "needs concurrent.futures")
+    def test_parallel_expansion_splits_a_calendar(self):
+        submitted = []
+
+        class RecordingExecutor(object):
+            def submit(self, fn, partition, *args):
+                submitted.append([event.title for _, event, _ in partition])
+                return futures.ThreadPoolExecutor(1).submit(fn, partition, *args)
+
+        events = engine.prepare_events(Event.objects.all())
+        expected = occurrences_for_events(events, self.start, self.end)
+        workers = engine.PARALLEL_EXPANSION_WORKERS
+        engine.PARALLEL_EXPANSION_WORKERS = 2
+        try:
+            occurrences = list(engine._expand_in_parallel(
+                RecordingExecutor(), events,
+                engine.persisted_occurrences_for_events(events, self.start, self.end),
+                self.start, self.end))
+        finally:
+            engine.PARALLEL_EXPANSION_WORKERS = workers
+        # all five events share a calendar
+        self.assertEqual(submitted, [['Show 0', 'Show 1', 'Show 2'], ['Show 3', 'Show 4']])
+        self.assertEqual([(o.event_id, o.start, o.pk) for o in occurrences],
+                         [(o.event_id, o.start, o.pk) for o in expected])
+
+    def test_resume_after_key(self):
+        until = self.end + datetime.timedelta(days=2)
+        expected = list(iter_occurrences_after(Event.objects.all(), self.start, until))
+        self.assertEqual(len(expected), 20)
+        pages = []
+        resume_after = None
+        while True:
+            page = list(iter_occurrences_after(
+                Event.objects.all(), self.start, until, limit=3, resume_after=resume_after))
+            if not page:
+                break
+            pages += page
+            resume_after = occurrence_key(page[-1])
+        self.assertEqual([occurrence_key(o) for o in pages], [occurrence_key(o) for o in expected])
+        self.assertEqual([o.pk for o in pages], [o.pk for o in expected])
@@ -2,6 +2,7 @@ import datetime
 
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
+from django.db.models.signals import pre_save
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils import timezone
@@ -468,6 +469,159 @@ class TestEvent(TestCase):
         )
         self.assertEqual(occurrences[-1].end, end_recurring)
 
+    def test_hourly_occurrences_across_dst_change(self):
+        # Detroit skips from 02:00 to 03:00 on March 13th 2016, so the 02:00
+        # wall clock occurrence localizes to the same instant as the 03:00 one
+        event = self.__create_recurring_event(
+            'Hourly event',
+            datetime.datetime(2016, 3, 13, 5, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 3, 13, 5, 30, tzinfo=pytz.utc),
+            datetime.datetime(2016, 3, 14, 0, 0, tzinfo=pytz.utc),
+            Rule.objects.create(frequency="HOURLY"),
+            Calendar.objects.create(name='MyCal', timezone=pytz.timezone('America/Detroit')),
+        )
+        event.save()
+        occurrences = event.get_occurrences(
+            datetime.datetime(2016, 3, 13, 5, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 3, 13, 10, 0, tzinfo=pytz.utc))
+        self.assertEqual([o.start.hour for o in occurrences], [5, 6, 7, 8, 9])
+
+
+    def test_overlapping(self):
+        cal = Calendar.objects.create(name='MyCal')
+        rule = Rule.objects.create(frequency="WEEKLY")
+        inside = self.__create_event(
+            'Inside', datetime.datetime(2008, 2, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 2, 5, 9, 0, tzinfo=pytz.utc), cal)
+        outside = self.__create_event(
+            'Outside', datetime.datetime(2008, 3, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 3, 5, 9, 0, tzinfo=pytz.utc), cal)
+        running = self.__create_recurring_event(
+            'Running', datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 5, 5, 0, 0, tzinfo=pytz.utc), rule, cal)
+        ended = self.__create_recurring_event(
+            'Ended', datetime.datetime(2007, 1, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2007, 1, 5, 9, 0, tzinfo=pytz.utc),
+            datetime.datetime(2007, 5, 5, 0, 0, tzinfo=pytz.utc), rule, cal)
+        for event in (inside, outside, running, ended):
+            event.save()
+        start = datetime.datetime(2008, 2, 1, 0, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2008, 3, 1, 0, 0, tzinfo=pytz.utc)
+        self.assertEqual(set(Event.objects.overlapping(start, end)), set([inside, running]))
+
+        # an occurrence moved into the window brings its event back in
+        occurrence = outside.get_occurrence(outside.start)
+        occurrence.move(datetime.datetime(2008, 2, 10, 8, 0, tzinfo=pytz.utc),
+                        datetime.datetime(2008, 2, 10, 9, 0, tzinfo=pytz.utc))
+        self.assertEqual(set(cal.event_set.overlapping(start, end)), set([inside, outside, running]))
+
+    def test_occurrence_bounds(self):
+        cal = Calendar.objects.create(name='MyCal', timezone=pytz.timezone('UTC'))
+        rule = Rule.objects.create(frequency="WEEKLY")
+        event = self.__create_recurring_event(
+            'Weekly', datetime.datetime(2008, 1, 5, 23, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 6, 1, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 2, 2, 23, 30, tzinfo=pytz.utc), rule, cal)
+        event.save()
+        self.assertEqual(event.first_occurrence_start, datetime.datetime(2008, 1, 5, 23, 0, tzinfo=pytz.utc))
+        self.assertEqual(event.last_occurrence_end, datetime.datetime(2008, 2, 3, 1, 0, tzinfo=pytz.utc))
+        self.assertEqual(event.occurrence_count, 5)
+        self.assertEqual(event.effective_end, event.last_occurrence_end)
+
+        # the last occurrence is still running after end_recurring_period
+        start = datetime.datetime(2008, 2, 3, 0, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2008, 2, 4, 0, 0, tzinfo=pytz.utc)
+        self.assertEqual(list(Event.objects.overlapping(start, end)), [event])
+        self.assertEqual(len(event.get_occurrences(start, end)), 1)
+
+        rule.params = 'interval:3'
+        rule.save()
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(event.occurrence_count, 2)
+        self.assertEqual(list(Event.objects.overlapping(start, end)), [])
+
+        one_off = self.__create_event(
+            'One off', datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc), cal)
+        one_off.save()
+        self.assertEqual((one_off.first_occurrence_start, one_off.last_occurrence_end, one_off.occurrence_count),
+                         (one_off.start, one_off.end, 1))
+
+        endless = self.__create_recurring_event(
+            'Endless', datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc), None, rule, cal)
+        endless.save()
+        self.assertEqual((endless.first_occurrence_start, endless.last_occurrence_end, endless.occurrence_count),
+                         (endless.start, None, None))
+
+    def test_occurrence_bounds_include_start_at_end_recurring_period(self):
+        cal = Calendar.objects.create(name='MyCal', timezone=pytz.timezone('UTC'))
+        event = self.__create_recurring_event(
+            'Daily', datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 8, 8, 0, tzinfo=pytz.utc),
+            Rule.objects.create(frequency="DAILY"), cal)
+        event.save()
+        last = list(event._occurrences_after_generator(event.start))[-1]
+        self.assertEqual(last.start, event.end_recurring_period)
+        self.assertEqual(event.last_occurrence_end, last.end)
+        self.assertEqual(event.occurrence_count, 4)
+        self.assertEqual(list(Event.objects.overlapping(last.start, last.end)), [event])
+
+    def test_occurrence_bounds_follow_calendar_timezone(self):
+        cal = Calendar.objects.create(name='MyCal', timezone=pytz.timezone('UTC'))
+        event = self.__create_recurring_event(
+            'Daily', datetime.datetime(2016, 3, 10, 12, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 3, 10, 13, 0, tzinfo=pytz.utc),
+            datetime.datetime(2016, 3, 20, 0, 0, tzinfo=pytz.utc),
+            Rule.objects.create(frequency="DAILY"), cal)
+        event.save()
+        self.assertEqual(event.last_occurrence_end, datetime.datetime(2016, 3, 19, 13, 0, tzinfo=pytz.utc))
+
+        # 07:00 in Detroit is an hour earlier in UTC after the DST change
+        cal.timezone = pytz.timezone('America/Detroit')
+        cal.save()
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(event.last_occurrence_end, datetime.datetime(2016, 3, 19, 12, 0, tzinfo=pytz.utc))
+        self.assertEqual(event.occurrence_count, 10)
+
+        # saves that leave the recurrence alone do not load the rule to
+        # recompute the bounds: the update and the calendar lookups of the
+        # optional_calendar and live-now handlers are all that runs
+        with self.assertNumQueries(3):
+            event.save(update_fields=['updated_on'])
+
+    def test_shift(self):
+        cal = Calendar.objects.create(name='MyCal', timezone=pytz.timezone('UTC'))
+        event = self.__create_recurring_event(
+            'Weekly', datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            datetime.datetime(2008, 2, 2, 23, 30, tzinfo=pytz.utc),
+            Rule.objects.create(frequency="WEEKLY"), cal)
+        event.save()
+        start = datetime.datetime(2008, 1, 1, 0, 0, tzinfo=pytz.utc)
+        end = datetime.datetime(2008, 1, 20, 0, 0, tzinfo=pytz.utc)
+        occurrences = event.get_occurrences(start, end)
+        occurrences[1].cancel()
+        event.shift(datetime.timedelta(hours=2), datetime.timedelta(hours=3))
+        persisted = event.occurrence_set.get(
+            original_start=datetime.datetime(2008, 1, 12, 10, 0, tzinfo=pytz.utc))
+        self.assertEqual(persisted.original_end, datetime.datetime(2008, 1, 12, 12, 0, tzinfo=pytz.utc))
+        event = Event.objects.get(pk=event.pk)
+        self.assertEqual(event.end, datetime.datetime(2008, 1, 5, 12, 0, tzinfo=pytz.utc))
+        self.assertEqual([o.cancelled for o in event.get_occurrences(start, end)], [False, True, False])
+
+        def fail(sender, **kwargs):
+            raise RuntimeError
+        pre_save.connect(fail, sender=Event)
+        try:
+            self.assertRaises(RuntimeError, event.shift,
+                              datetime.timedelta(hours=1), datetime.timedelta(hours=1))
+        finally:
+            pre_save.disconnect(fail, sender=Event)
+        self.assertEqual(event.end, datetime.datetime(2008, 1, 5, 12, 0, tzinfo=pytz.utc))
+        self.assertEqual(event.occurrence_set.get().original_start, persisted.original_start)
 
     def test_(self):
         pass
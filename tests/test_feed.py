@@ -1,8 +1,12 @@
 import datetime
+import pytz
 
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.test import TestCase
 
 from schedule.feeds.atom import rfc3339_date, get_tag_uri
+from schedule.models import Calendar, Event
 
 class Testatom(TestCase):
 
@@ -17,3 +21,31 @@ class Testatom(TestCase):
         result = get_tag_uri('/sarasa/', date)
         expected = 'tag:,2014-2-25:/sarasa/'
         self.assertEqual(result, expected)
+
+
+class TestCalendarICalendar(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.calendar = Calendar.objects.create(name="MyCal", slug='MyCalSlug')
+        self.event = Event.objects.create(
+            title='Show', calendar=self.calendar,
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc))
+        self.url = reverse('calendar_ical', args=[self.calendar.pk])
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'SUMMARY:Show', response.content)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_writes_change_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        self.event.title = 'Renamed'
+        self.event.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'SUMMARY:Renamed', response.content)
+        self.event.delete()
+        self.assertNotEqual(self.client.get(self.url)['ETag'], response['ETag'])
@@ -1,7 +1,10 @@
 # coding=utf-8
 import datetime
+import pytz
+from django import forms
 from django.test import TestCase
-from schedule.forms import EventForm
+from schedule.forms import EventForm, check_event_conflicts, find_conflicts
+from schedule.models import Calendar, Event, Occurrence, Rule
 
 
 class TestScheduleForms(TestCase):
@@ -38,3 +41,58 @@ class TestScheduleForms(TestCase):
         self.assertEqual(len(form.errors['start']), 1)
         self.assertEqual(form.errors['start'][0], u"This field is required.")
 
+
+
+class _ConflictForm(object):
+    def __init__(self, instance=None, **cleaned_data):
+        self.cleaned_data = cleaned_data
+        self.instance = instance or Event()
+
+
+class TestConflicts(TestCase):
+
+    def setUp(self):
+        self.cal = Calendar.objects.create(name="MyCal")
+        self.daily = Rule.objects.create(frequency="DAILY")
+        Event.objects.create(
+            title='Morning show',
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2008, 1, 10, 0, 0, tzinfo=pytz.utc),
+            rule=self.daily,
+            calendar=self.cal)
+
+    def occurrence(self, start_hour, end_hour, day=5, cancelled=False):
+        return Occurrence(
+            start=datetime.datetime(2008, 1, day, start_hour, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, day, end_hour, 0, tzinfo=pytz.utc),
+            cancelled=cancelled)
+
+    def test_find_conflicts(self):
+        others = [self.occurrence(8, 9), self.occurrence(10, 12), self.occurrence(11, 13, cancelled=True)]
+        candidates = [self.occurrence(9, 10), self.occurrence(7, 11), self.occurrence(11, 12)]
+        conflicts = find_conflicts(candidates, others)
+        self.assertEqual(
+            [(occ.start.hour, other.start.hour) for occ, other in conflicts],
+            [(7, 8), (7, 10), (11, 10)])
+
+    def test_event_conflicts_are_all_reported(self):
+        form = _ConflictForm(
+            calendar=self.cal,
+            start=datetime.datetime(2008, 1, 3, 8, 30, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 3, 9, 30, tzinfo=pytz.utc),
+            rule=self.daily,
+            end_recurring_period=datetime.datetime(2008, 1, 8, 0, 0, tzinfo=pytz.utc))
+        with self.assertRaises(forms.ValidationError) as raised:
+            check_event_conflicts(form)
+        # Jan 5th, 6th and 7th
+        self.assertEqual(len(raised.exception.messages), 3)
+
+    def test_event_without_conflicts(self):
+        form = _ConflictForm(
+            calendar=self.cal,
+            start=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 10, 0, tzinfo=pytz.utc),
+            rule=None,
+            end_recurring_period=None)
+        check_event_conflicts(form)
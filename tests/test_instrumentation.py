@@ -0,0 +1,84 @@
+import datetime
+from unittest import skipIf
+
+import django
+import pytz
+from django.http import HttpResponse
+from django.test import TestCase
+from django.test.client import RequestFactory
+
+from schedule import instrumentation, middleware
+from schedule.engine import occurrences_for_events
+from schedule.models import Calendar, Event, Occurrence, Rule
+
+
+class TestInstrumentation(TestCase):
+    def setUp(self):
+        rule = Rule.objects.create(frequency="DAILY")
+        cal = Calendar.objects.create(name="MyCal")
+        self.event = Event.objects.create(**{
+            'title': 'Daily show',
+            'start': datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            'end': datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            'end_recurring_period': datetime.datetime(2008, 5, 5, 0, 0, tzinfo=pytz.utc),
+            'rule': rule,
+            'calendar': cal,
+        })
+        Occurrence.objects.create(
+            event=self.event,
+            title='Moved show',
+            start=datetime.datetime(2008, 1, 6, 10, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 6, 11, 0, tzinfo=pytz.utc),
+            original_start=datetime.datetime(2008, 1, 6, 8, 0, tzinfo=pytz.utc),
+            original_end=datetime.datetime(2008, 1, 6, 9, 0, tzinfo=pytz.utc))
+        self.start = datetime.datetime(2008, 1, 5, 0, 0, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 1, 8, 0, 0, tzinfo=pytz.utc)
+
+    def tearDown(self):
+        instrumentation.stop()
+
+    def test_counters_are_noops_when_not_started(self):
+        instrumentation.incr('events_expanded')
+        with instrumentation.phase('expand'):
+            pass
+        self.assertIsNone(instrumentation.current())
+
+    def test_occurrence_generation_is_counted(self):
+        stats = instrumentation.start()
+        occurrences_for_events(Event.objects.all(), self.start, self.end)
+        instrumentation.stop()
+        self.assertEqual(stats.counters['events_expanded'], 1)
+        self.assertEqual(stats.counters['occurrences_generated'], 3)
+        self.assertEqual(stats.counters['replacer_matches'], 1)
+        self.assertEqual(stats.counters['queries'], 2)
+        self.assertIn('expand', stats.timings)
+
+    def test_middleware_sets_server_timing(self):
+        request = RequestFactory().get('/')
+        instrumented = middleware.InstrumentationMiddleware()
+        hook_calls = []
+        original = middleware.INSTRUMENTATION, middleware.INSTRUMENTATION_HOOK_FUNC
+        middleware.INSTRUMENTATION = True
+        middleware.INSTRUMENTATION_HOOK_FUNC = lambda request, stats: hook_calls.append(stats.as_dict())
+        try:
+            instrumented.process_request(request)
+            self.event.get_occurrences(self.start, self.end)
+            response = instrumented.process_response(request, HttpResponse())
+        finally:
+            middleware.INSTRUMENTATION, middleware.INSTRUMENTATION_HOOK_FUNC = original
+        self.assertIn('schedule-expand;dur=', response['Server-Timing'])
+        self.assertIn('schedule-events_expanded;desc="1"', response['Server-Timing'])
+        self.assertEqual(hook_calls[0]['counters']['events_expanded'], 1)
+
+    @skipIf(django.VERSION < (1, 10), "MIDDLEWARE is new in Django 1.10")
+    def test_new_style_middleware(self):
+        def view(request):
+            self.event.get_occurrences(self.start, self.end)
+            return HttpResponse()
+        original = middleware.INSTRUMENTATION
+        middleware.INSTRUMENTATION = True
+        try:
+            response = middleware.InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        finally:
+            middleware.INSTRUMENTATION = original
+        self.assertIn('schedule-events_expanded;desc="1"', response['Server-Timing'])
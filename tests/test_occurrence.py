@@ -4,7 +4,7 @@ import pytz
 from django.test import TestCase
 
 from schedule.models import Event, Rule, Calendar
-from schedule.models.events import Occurrence
+from schedule.models.events import Occurrence, VirtualOccurrence
 from schedule.periods import Period
 
 
@@ -62,6 +62,42 @@ class TestOccurrence(TestCase):
         self.assertFalse(period_pre.has_occurrences())
         self.assertTrue(period_post.has_occurrences())
 
+    def test_persisted_occurrences_in_window(self):
+        occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        occurrences[0].save()
+        moved_start = datetime.datetime(2008, 3, 1, 8, 0, tzinfo=pytz.utc)
+        occurrences[1].move(moved_start, moved_start + datetime.timedelta(hours=1))
+        occurrences[2].save()
+        duration = datetime.timedelta(hours=1)
+
+        def in_window(start, end):
+            window = self.recurring_event.occurrence_set.in_window(start, end, duration)
+            return [occurrence.original_start for occurrence in window]
+        self.assertEqual(in_window(self.start, self.start + datetime.timedelta(days=1)),
+                         [occurrences[0].original_start])
+        self.assertEqual(in_window(moved_start, moved_start + datetime.timedelta(days=1)),
+                         [occurrences[1].original_start])
+        self.assertEqual(in_window(self.end, self.end + datetime.timedelta(days=7)), [])
+        after = list(self.recurring_event.occurrences_after(self.start, max_occurences=3))
+        self.assertEqual([bool(occurrence.pk) for occurrence in after], [True, True, True])
+        self.assertEqual(after[1].start, moved_start)
+
+    def test_update_occurrences(self):
+        occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        occurrences[0].save()
+        original_starts = [occurrences[0].start, occurrences[1].start]
+        hour = datetime.timedelta(hours=1)
+        updated = self.recurring_event.update_occurrences(
+            original_starts, cancelled=True, title='Rained out', delta_start=hour, delta_end=hour)
+        self.assertEqual(sorted(o.original_start for o in updated), original_starts)
+        self.assertEqual(Occurrence.objects.count(), 2)
+        for occurrence in Occurrence.objects.all():
+            self.assertTrue(occurrence.cancelled)
+            self.assertEqual(occurrence.title, 'Rained out')
+            self.assertEqual(occurrence.start, occurrence.original_start + hour)
+        with self.assertRaises(ValueError):
+            self.recurring_event.update_occurrences([self.start])
+
     def test_cancelled_occurrences(self):
         occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
         cancelled_occurrence = occurrences[2]
@@ -72,6 +108,21 @@ class TestOccurrence(TestCase):
         occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
         self.assertFalse(occurrences[2].cancelled)
 
+    def test_generated_occurrences_are_virtual(self):
+        occurrences = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        occurrence = occurrences[0]
+        self.assertIsInstance(occurrence, VirtualOccurrence)
+        self.assertFalse(hasattr(occurrence, '__dict__'))
+        self.assertEqual(occurrence.title, self.recurring_event.title)
+        self.assertIsNone(occurrence.pk)
+        occurrence.cancel()
+        occurrence.uncancel()
+        self.assertEqual(Occurrence.objects.count(), 1)
+        persisted = Occurrence.objects.get()
+        self.assertEqual(occurrence.pk, persisted.pk)
+        self.assertEqual(persisted, occurrence)
+        self.assertFalse(persisted.cancelled)
+
     def test_occurrence_eq_method(self):
         event2 = Event.objects.create(**self.recurring_data)
         self.assertEqual(self.recurring_event.get_occurrences(start=self.start, end=self.end)[0],
@@ -81,6 +132,21 @@ class TestOccurrence(TestCase):
         self.assertNotEqual(self.recurring_event.get_occurrences(start=self.start, end=self.end)[0],
                             event2)
 
+    def test_occurrence_hash_matches_virtual(self):
+        generated = self.recurring_event.get_occurrences(start=self.start, end=self.end)
+        persisted = generated[0].to_occurrence()
+        persisted.save()
+        self.assertEqual(hash(persisted), hash(generated[0]))
+        self.assertEqual(set([persisted]) & set(generated), set([persisted]))
+        # unsaved occurrences are hashable too
+        hash(Occurrence())
+
+    def test_occurrence_of_unsaved_event(self):
+        event = Event(**self.data)
+        occurrence = Occurrence(event=event, start=event.start, end=event.end,
+                                original_start=event.start, original_end=event.end)
+        self.assertEqual(occurrence.title, 'Recent Event')
+
     def test_create_occurrence_without_event(self):
         """
         may be required for creating formsets, for example in admin
@@ -0,0 +1,151 @@
+import datetime
+import pytz
+
+from django.test import TestCase
+from django.utils import timezone
+
+from schedule import signals, views
+from schedule.conf.settings import OCCURRENCE_INDEX_LOOKBACK
+from schedule.models import Event, Rule, Calendar, Occurrence, OccurrenceIndex, OccurrenceIndexRange
+
+
+def _recent_midnight():
+    # the index is only built from OCCURRENCE_INDEX_LOOKBACK before now
+    return timezone.now().replace(hour=0, minute=0, second=0, microsecond=0) - datetime.timedelta(days=7)
+
+
+class TestOccurrenceIndex(TestCase):
+    def setUp(self):
+        rule = Rule.objects.create(frequency="WEEKLY")
+        cal = Calendar.objects.create(name="MyCal", timezone=pytz.utc)
+        midnight = _recent_midnight()
+        self.event = Event.objects.create(**{
+            'title': 'Recent Event',
+            'start': midnight + datetime.timedelta(hours=8),
+            'end': midnight + datetime.timedelta(hours=9),
+            'end_recurring_period': midnight + datetime.timedelta(days=121),
+            'rule': rule,
+            'calendar': cal
+        })
+        self.start = midnight + datetime.timedelta(days=7)
+        self.end = midnight + datetime.timedelta(days=22)
+
+    def test_rebuild_matches_expansion(self):
+        OccurrenceIndex.objects.rebuild_for_event(self.event)
+        self.assertEqual(OccurrenceIndex.objects.filter(event=self.event).count(), 18)
+        indexed = OccurrenceIndex.objects.occurrences_in_window(self.start, self.end)
+        expanded = self.event.get_occurrences(self.start, self.end)
+        self.assertEqual([(o.start, o.end) for o in indexed],
+                         [(o.start, o.end) for o in expanded])
+
+    def test_rebuild_includes_persisted_occurrences(self):
+        occurrence = self.event.get_occurrences(self.start, self.end)[0]
+        occurrence.move(occurrence.start + datetime.timedelta(hours=2),
+                        occurrence.end + datetime.timedelta(hours=2))
+        OccurrenceIndex.objects.rebuild_for_event(self.event)
+        indexed = OccurrenceIndex.objects.occurrences_in_window(self.start, self.end)
+        self.assertEqual(indexed[0].pk, occurrence.pk)
+        self.assertEqual(indexed[0].start, self.start + datetime.timedelta(hours=10))
+        self.assertFalse(indexed[1].pk)
+
+    def test_window_restricted_to_events(self):
+        OccurrenceIndex.objects.rebuild_for_event(self.event)
+        self.assertEqual(
+            OccurrenceIndex.objects.occurrences_in_window(self.start, self.end, Event.objects.none()), [])
+
+    def test_covers(self):
+        now = timezone.now()
+        self.assertFalse(OccurrenceIndex.objects.covers(self.start, self.end))
+        OccurrenceIndex.objects.rebuild_for_event(self.event)
+        self.assertTrue(OccurrenceIndex.objects.covers(self.start, self.end))
+        self.assertTrue(OccurrenceIndex.objects.covers(self.start, self.end, [self.event]))
+        self.assertFalse(OccurrenceIndex.objects.covers(self.start, now + datetime.timedelta(days=10000)))
+        self.assertFalse(OccurrenceIndex.objects.covers(now - datetime.timedelta(days=10000), self.end))
+        # an event that was never indexed
+        Event.objects.create(title='Other', start=self.start, end=self.end, calendar=self.event.calendar)
+        self.assertFalse(OccurrenceIndex.objects.covers(self.start, self.end))
+        self.assertTrue(OccurrenceIndex.objects.covers(self.start, self.end, [self.event]))
+
+    def test_rebuild_starts_at_lookback(self):
+        rule = Rule.objects.create(frequency="DAILY")
+        old = Event.objects.create(
+            title='Old', rule=rule, calendar=self.event.calendar,
+            start=datetime.datetime(1995, 1, 1, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(1995, 1, 1, 9, 0, tzinfo=pytz.utc))
+        OccurrenceIndex.objects.rebuild_for_event(old)
+        lookback = timezone.now() - OCCURRENCE_INDEX_LOOKBACK
+        self.assertFalse(OccurrenceIndex.objects.filter(event=old, utc_end__lte=lookback).exists())
+        self.assertEqual(old.occurrence_index_range.start.date(), lookback.date())
+
+    def test_expired_range_falls_back_to_expansion(self):
+        signals.USE_OCCURRENCE_INDEX = views.USE_OCCURRENCE_INDEX = True
+        try:
+            OccurrenceIndex.objects.rebuild_for_event(self.event)
+            # the daily rebuild stopped before the window
+            OccurrenceIndexRange.objects.update(end=self.start)
+            OccurrenceIndex.objects.filter(event=self.event).delete()
+            occurrences = list(views._occurrences_in_window(
+                self.start, self.end, [self.event.calendar]))
+        finally:
+            signals.USE_OCCURRENCE_INDEX = views.USE_OCCURRENCE_INDEX = False
+        self.assertEqual(len(occurrences), 3)
+
+
+class TestOccurrenceIndexSignals(TestCase):
+    def setUp(self):
+        self.use_index = signals.USE_OCCURRENCE_INDEX, views.USE_OCCURRENCE_INDEX
+        signals.USE_OCCURRENCE_INDEX = views.USE_OCCURRENCE_INDEX = True
+        self.calendar = Calendar.objects.create(name="MyCal", timezone=pytz.utc)
+        midnight = _recent_midnight()
+        self.events = [Event.objects.create(**{
+            'title': 'Show %d' % hour,
+            'start': midnight + datetime.timedelta(hours=hour),
+            'end': midnight + datetime.timedelta(hours=hour, minutes=30),
+            'end_recurring_period': midnight + datetime.timedelta(days=121),
+            'rule': Rule.objects.create(frequency="WEEKLY"),
+            'calendar': self.calendar
+        }) for hour in (10, 8)]
+        self.start = midnight + datetime.timedelta(days=7)
+        self.end = midnight + datetime.timedelta(days=22)
+
+    def tearDown(self):
+        signals.USE_OCCURRENCE_INDEX, views.USE_OCCURRENCE_INDEX = self.use_index
+
+    def assertIndexMatchesExpansion(self):
+        indexed = OccurrenceIndex.objects.occurrences_in_window(self.start, self.end)
+        expanded = []
+        for event in self.events:
+            expanded += event.get_occurrences(self.start, self.end)
+        self.assertEqual([(o.event_id, o.start, o.end, o.pk, o.cancelled) for o in indexed],
+                         [(o.event_id, o.start, o.end, o.pk, o.cancelled) for o in expanded])
+
+    def test_event_save_builds_rows(self):
+        self.assertEqual(OccurrenceIndex.objects.filter(event=self.events[0]).count(), 18)
+        self.assertIndexMatchesExpansion()
+
+    def test_occurrence_writes_replace_their_row(self):
+        event = self.events[0]
+        occurrence = event.get_occurrences(self.start, self.end)[0]
+        occurrence.move(occurrence.start + datetime.timedelta(hours=2),
+                        occurrence.end + datetime.timedelta(hours=2))
+        self.assertEqual(OccurrenceIndex.objects.filter(event=event).count(), 18)
+        self.assertIndexMatchesExpansion()
+
+        Occurrence.objects.get(pk=occurrence.pk).delete()
+        self.assertFalse(OccurrenceIndex.objects.filter(occurrence__isnull=False).exists())
+        self.assertEqual(OccurrenceIndex.objects.filter(event=event).count(), 18)
+        self.assertIndexMatchesExpansion()
+
+    def test_event_delete_leaves_no_rows(self):
+        event = self.events[0]
+        event.get_occurrences(self.start, self.end)[0].cancel()
+        event.delete()
+        self.assertFalse(OccurrenceIndex.objects.filter(event_id=event.pk).exists())
+
+    def test_read_path_matches_expansion(self):
+        self.events[1].get_occurrences(self.start, self.end)[1].cancel()
+        indexed = list(views._occurrences_in_window(self.start, self.end, [self.calendar]))
+        views.USE_OCCURRENCE_INDEX = False
+        expanded = list(views._occurrences_in_window(self.start, self.end, [self.calendar]))
+        self.assertEqual([(o.event_id, o.start, o.pk, o.cancelled) for o in indexed],
+                         [(o.event_id, o.start, o.pk, o.cancelled) for o in expanded])
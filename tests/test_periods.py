@@ -286,6 +286,22 @@ class TestOccurrencePool(TestCase):
         period = Period(parent_period.events, start, end, parent_period.get_persisted_occurrences(), parent_period.occurrences)
         self.assertEqual(parent_period.occurrences, period.occurrences)
 
+    def test_year_is_expanded_once(self):
+        year = Year(Event.objects.all(), datetime.datetime(2008, 1, 1, tzinfo=pytz.utc))
+        with self.assertNumQueries(2):
+            counts = [sum(len(day.occurrences) for week in month.get_weeks() for day in week.get_days()
+                          if day.start.month == month.start.month)
+                      for month in year.get_months()]
+        self.assertEqual(counts, [4, 4, 5, 4, 1, 0, 0, 0, 0, 0, 0, 0])
+
+    def test_neighbours_slice_the_pool(self):
+        year = Year(Event.objects.all(), datetime.datetime(2008, 1, 1, tzinfo=pytz.utc))
+        february = list(year.get_months())[1]
+        with self.assertNumQueries(0):
+            march = february.next_month()
+            self.assertEqual(len(march.occurrences), 5)
+            self.assertEqual(march.get_persisted_occurrences(), year.get_persisted_occurrences())
+
 
 class TestAwareDay(TestCase):
     def setUp(self):
@@ -0,0 +1,59 @@
+import datetime
+import random
+
+from dateutil import rrule
+from django.test import SimpleTestCase
+
+from schedule.recurrence import SimpleRecurrence
+
+
+class TestSimpleRecurrence(SimpleTestCase):
+    """
+    Property tests checking the arithmetic expansion against dateutil on
+    randomly generated rules and windows.
+    """
+
+    def random_case(self, rand):
+        frequency = rand.choice([rrule.HOURLY, rrule.DAILY, rrule.WEEKLY])
+        dtstart = datetime.datetime(2008, 1, 1) + datetime.timedelta(
+            days=rand.randint(0, 400), hours=rand.randint(0, 23), minutes=rand.choice([0, 15, 30]))
+        params = {}
+        if rand.random() < 0.5:
+            params['interval'] = rand.randint(1, 5)
+        if rand.random() < 0.3:
+            params['count'] = rand.randint(1, 50)
+        if rand.random() < 0.5:
+            if frequency == rrule.WEEKLY:
+                params['byweekday'] = [dtstart.weekday()]
+            else:
+                params['byweekday'] = rand.sample(range(7), rand.randint(1, 6))
+                params.pop('count', None)
+        if rand.random() < 0.2:
+            params['byminute'] = dtstart.minute
+        return frequency, dtstart, params
+
+    def test_equivalent_to_dateutil(self):
+        rand = random.Random(20081201)
+        for _ in range(150):
+            frequency, dtstart, params = self.random_case(rand)
+            expected = rrule.rrule(frequency, dtstart=dtstart, **params)
+            recurrence = SimpleRecurrence.build(frequency, dtstart, params)
+            self.assertIsNotNone(recurrence, (frequency, dtstart, params))
+            for _ in range(5):
+                after = dtstart + datetime.timedelta(hours=rand.randint(-100, 5000), minutes=rand.choice([0, 15, 30]))
+                before = after + datetime.timedelta(hours=rand.randint(0, 2000))
+                for inc in (False, True):
+                    self.assertEqual(recurrence.between(after, before, inc=inc),
+                                     expected.between(after, before, inc=inc))
+                    self.assertEqual(recurrence.after(after, inc=inc), expected.after(after, inc=inc))
+            if 'count' in params:
+                self.assertEqual(list(recurrence), list(expected))
+
+    def test_complex_rules_fall_back(self):
+        dtstart = datetime.datetime(2008, 1, 1, 8, 0)
+        self.assertIsNone(SimpleRecurrence.build(rrule.MONTHLY, dtstart, {}))
+        self.assertIsNone(SimpleRecurrence.build(rrule.DAILY, dtstart, {'bysetpos': 1}))
+        self.assertIsNone(SimpleRecurrence.build(rrule.YEARLY, dtstart, {'byeaster': 0}))
+        self.assertIsNone(SimpleRecurrence.build(rrule.DAILY, dtstart, {'byhour': [8, 20]}))
+        self.assertIsNone(SimpleRecurrence.build(rrule.WEEKLY, dtstart, {'byweekday': [0, 1]}))
+        self.assertIsNone(SimpleRecurrence.build(rrule.DAILY, dtstart, {'byweekday': [0], 'count': 3}))
@@ -91,3 +91,18 @@ class TestTemplateTags(TestCase):
 
         slots = _cook_slots(period, 60)
         self.assertEqual(len(slots), 24)
+
+    def test_cook_slots_expands_once(self):
+        start = datetime.datetime(datetime.datetime.now().year, 1, 5, 0, 0, tzinfo=pytz.utc)
+        event = Event.objects.create(
+            title='Late Morning Event',
+            start=start + datetime.timedelta(hours=10, minutes=15),
+            end=start + datetime.timedelta(hours=11, minutes=45),
+            calendar=self.cal)
+        period = Day(Event.objects.filter(pk=event.pk), start)
+        with self.assertNumQueries(2):
+            slots = _cook_slots(period, 30)
+            counts = [len(slot.occurrences) for slot in slots]
+        self.assertEqual(len(slots), 48)
+        self.assertEqual(counts[19:25], [0, 1, 1, 1, 1, 0])
+        self.assertEqual(sum(counts), 4)
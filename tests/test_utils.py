@@ -1,10 +1,15 @@
 import datetime
+import pytz
 
+from django.http import JsonResponse, StreamingHttpResponse
 from django.test import TestCase
 from django.utils import timezone
 
+from schedule import instrumentation
 from schedule.models import Event, Rule, Calendar
-from schedule.utils import EventListManager
+from schedule.models.events import Occurrence
+from schedule.utils import (EventListManager, OccurrenceReplacer, RRuleCache, iter_json_array,
+                            rrule_cache)
 
 
 class TestEventListManager(TestCase):
@@ -47,3 +52,149 @@ class TestEventListManager(TestCase):
         self.assertEqual(next(occurrences).event, self.event1)
         occurrences = eml.occurrences_after()
         self.assertEqual(list(occurrences), [])
+
+    def test_occurrences_after_ties_are_ordered_by_event(self):
+        twin = Event.objects.create(**{
+            'title': 'Twin Event',
+            'start': self.event1.start,
+            'end': self.event1.end,
+            'end_recurring_period': self.event1.end_recurring_period,
+            'rule': self.event1.rule,
+            'calendar': self.event1.calendar
+        })
+        eml = EventListManager([twin, self.event1])
+        occurrences = list(eml.occurrences_after(
+            datetime.datetime(2009, 4, 1, 0, 0, tzinfo=self.default_tzinfo), limit=4))
+        self.assertEqual([o.event for o in occurrences], [self.event1, twin, self.event1, twin])
+
+    def test_occurrences_after_until_and_persisted(self):
+        after = datetime.datetime(2009, 4, 1, 0, 0, tzinfo=self.default_tzinfo)
+        until = datetime.datetime(2009, 4, 4, 0, 0, tzinfo=self.default_tzinfo)
+        eml = EventListManager(Event.objects.all())
+        moved = next(eml.occurrences_after(after))
+        moved.move(moved.start + datetime.timedelta(days=1), moved.end + datetime.timedelta(days=1))
+        occurrences = list(eml.occurrences_after(after, until=until))
+        self.assertEqual([(o.event, o.pk) for o in occurrences], [
+            (self.event2, None),
+            (self.event1, moved.pk),
+            (self.event2, None),
+            (self.event2, None),
+        ])
+
+    def test_occurrences_after_expands_from_after(self):
+        old = Event.objects.create(**{
+            'title': 'Old Event',
+            'start': datetime.datetime(1995, 1, 1, 8, 0, tzinfo=pytz.utc),
+            'end': datetime.datetime(1995, 1, 1, 9, 0, tzinfo=pytz.utc),
+            'rule': Rule.objects.create(frequency="HOURLY"),
+            'calendar': self.event1.calendar
+        })
+        stats = instrumentation.start()
+        try:
+            occurrences = list(EventListManager([old]).occurrences_after(
+                datetime.datetime(2016, 1, 1, 0, 0, tzinfo=pytz.utc), limit=5))
+        finally:
+            instrumentation.stop()
+        self.assertEqual(len(occurrences), 5)
+        # a day of slack and the occurrences taken, not two decades of them
+        self.assertLess(stats.counters['occurrences_generated'], 50)
+
+
+class TestOccurrenceReplacer(TestCase):
+    def setUp(self):
+        cal = Calendar.objects.create(name="MyCal")
+        self.event = Event.objects.create(
+            title='Daily', calendar=cal, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2008, 2, 5, 0, 0, tzinfo=pytz.utc))
+        self.start = datetime.datetime(2008, 1, 10, 0, 0, tzinfo=pytz.utc)
+        self.end = datetime.datetime(2008, 1, 12, 0, 0, tzinfo=pytz.utc)
+
+    def test_values_rows(self):
+        occurrences = self.event.get_occurrences(self.start, self.end)
+        occurrences[0].save()
+        rows = Occurrence.objects.values_list('event_id', 'original_start', 'original_end')
+        replacer = OccurrenceReplacer(rows)
+        self.assertEqual([replacer.has_occurrence(o) for o in occurrences], [True, False])
+        # rows have nothing to replace the generated occurrences with
+        self.assertEqual(replacer.get_occurrences(occurrences), occurrences)
+        self.assertEqual([replacer.drop(o) for o in occurrences], [True, False])
+        self.assertFalse(replacer.has_occurrence(occurrences[0]))
+
+    def test_additional_occurrences(self):
+        occurrences = self.event.get_occurrences(self.start, self.end)
+        moved = occurrences[0]
+        moved.move(moved.start + datetime.timedelta(days=5), moved.end + datetime.timedelta(days=5))
+        persisted = Occurrence.objects.get()
+        with self.assertNumQueries(0):
+            replacer = OccurrenceReplacer([persisted])
+            self.assertEqual(replacer.get_additional_occurrences(self.start, self.end), [])
+            self.assertEqual(replacer.get_additional_occurrences(moved.start, moved.end), [persisted])
+            self.assertEqual(replacer.get_occurrences(occurrences), [persisted, occurrences[1]])
+            self.assertEqual(replacer.get_additional_occurrences(moved.start, moved.end), [])
+
+    def test_add_batches_out_of_order(self):
+        occurrences = self.event.get_occurrences(
+            datetime.datetime(2008, 1, 5, tzinfo=pytz.utc), datetime.datetime(2008, 1, 14, tzinfo=pytz.utc))
+        for occurrence in occurrences:
+            occurrence.start += datetime.timedelta(hours=1)
+            occurrence.end += datetime.timedelta(hours=1)
+        replacer = OccurrenceReplacer(occurrences[3:6])
+        replacer.add(occurrences[6:])
+        replacer.add(occurrences[:3])
+        self.assertEqual(replacer.get_additional_occurrences(self.start, self.end), occurrences[5:7])
+        self.assertEqual(replacer.get_additional_occurrences(occurrences[0].start, self.end),
+                         occurrences[:7])
+
+
+class TestRRuleCache(TestCase):
+    def setUp(self):
+        rrule_cache.clear()
+        self.rule = Rule.objects.create(frequency="WEEKLY")
+        self.event = Event.objects.create(**{
+            'title': 'Weekly Event',
+            'start': datetime.datetime(2009, 4, 1, 8, 0, tzinfo=pytz.utc),
+            'end': datetime.datetime(2009, 4, 1, 9, 0, tzinfo=pytz.utc),
+            'end_recurring_period': datetime.datetime(2009, 10, 5, 0, 0, tzinfo=pytz.utc),
+            'rule': self.rule,
+            'calendar': Calendar.objects.create(name="MyCal")
+        })
+
+    def test_rrule_is_reused(self):
+        first = self.event.get_rrule_object(pytz.utc)
+        self.assertIs(self.event.get_rrule_object(pytz.utc), first)
+        self.assertEqual(rrule_cache.info()['misses'], 1)
+        self.assertEqual(rrule_cache.info()['hits'], 1)
+
+    def test_rule_change_invalidates(self):
+        self.event.get_rrule_object(pytz.utc)
+        self.rule.frequency = "DAILY"
+        self.rule.save()
+        self.assertEqual(rrule_cache.info()['size'], 0)
+        event = Event.objects.get(pk=self.event.pk)
+        occurrences = event.get_occurrences(
+            datetime.datetime(2009, 4, 1, 0, 0, tzinfo=pytz.utc),
+            datetime.datetime(2009, 4, 4, 0, 0, tzinfo=pytz.utc))
+        self.assertEqual(len(occurrences), 3)
+
+    def test_lru_eviction(self):
+        cache = RRuleCache(2)
+        for key in range(3):
+            cache.get(key, lambda: key)
+        self.assertEqual(cache.get(0, lambda: 'rebuilt'), 'rebuilt')
+        self.assertEqual(cache.get(2, lambda: 'rebuilt'), 2)
+
+
+class TestIterJsonArray(TestCase):
+    def test_matches_json_response(self):
+        data = [{'id': str(i), 'title': u'Show \xe9 %d' % i, 'existed': bool(i % 2),
+                 'start': datetime.datetime(2008, 1, 5, i, tzinfo=pytz.utc)} for i in range(20)]
+        buffered = JsonResponse(data, safe=False).content
+        for chunk_size in (1, 100, 8192):
+            streamed = StreamingHttpResponse(iter_json_array(iter(data), chunk_size))
+            self.assertEqual(b''.join(streamed.streaming_content), buffered)
+
+    def test_empty(self):
+        streamed = StreamingHttpResponse(iter_json_array(iter([])))
+        self.assertEqual(b''.join(streamed.streaming_content), JsonResponse([], safe=False).content)
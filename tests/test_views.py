@@ -2,15 +2,22 @@ import datetime
 import json
 import pytz
 
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from django.test.utils import override_settings
 from django.test import TestCase
+from django.utils import timezone
 from django.core.urlresolvers import reverse
+from django.http import StreamingHttpResponse
 
 from schedule.models.calendars import Calendar
 from schedule.models.events import Event, Occurrence
 from schedule.models.rules import Rule
 
-from schedule.views import coerce_date_dict
+from schedule import instrumentation, livenow
+from schedule.views import coerce_date_dict, _api_occurrences_page, _live_now_payload
 
 from schedule.conf.settings import USE_FULLCALENDAR
 
@@ -282,3 +289,215 @@ class TestUrls(TestCase):
         resp_list = json.loads(response.content.decode('utf-8'))
         self.assertIn(event1.title, [d['title'] for d in resp_list])
         self.assertNotIn(event2.title, [d['title'] for d in resp_list])
+
+
+class TestOccurrencesFields(TestCase):
+    def setUp(self):
+        calendar = Calendar.objects.create(name="MyCal", slug='MyCalSlug')
+        self.event = Event.objects.create(
+            title='Daily', calendar=calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2008, 2, 5, 0, 0, tzinfo=pytz.utc))
+        self.event.get_occurrences(datetime.datetime(2008, 1, 7, tzinfo=pytz.utc),
+                                   datetime.datetime(2008, 1, 8, tzinfo=pytz.utc))[0].cancel()
+        self.url = reverse('api_occurrences')
+
+    def test_projection(self):
+        response = self.client.get(self.url, {
+            'start': '2008-01-05', 'end': '2008-01-10', 'include_cancelled': 'true',
+            'fields': 'id,title,start,end'})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(len(data), 5)
+        for item in data:
+            self.assertEqual(sorted(item), ['end', 'id', 'start', 'title'])
+            self.assertEqual(item['title'], 'Daily')
+
+    def test_projection_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(self.url, {
+                'start': '2008-01-05', 'end': '2008-01-10', 'include_cancelled': 'true',
+                'fields': 'id,title,start,end'})
+        self.assertEqual(response.status_code, 200)
+        # the events (with rule and calendar joined) and their persisted occurrences
+        self.assertEqual(len(context.captured_queries), 2)
+        for query in context.captured_queries:
+            sql = query['sql'].lower()
+            for table in ('schedule_event', 'schedule_occurrence'):
+                self.assertNotIn('"%s"."description"' % table, sql)
+                self.assertNotIn('"%s"."image"' % table, sql)
+            self.assertNotIn('livestreamurl', sql)
+
+    def test_stream(self):
+        for start, end in (('2008-01-05', '2008-01-10'), ('2010-01-05', '2010-01-10')):
+            params = {'start': start, 'end': end, 'fields': 'id,title,start,end'}
+            buffered = self.client.get(self.url, params)
+            streamed = self.client.get(self.url, dict(params, stream='true'))
+            self.assertIsInstance(streamed, StreamingHttpResponse)
+            self.assertEqual(streamed['Content-Type'], 'application/json')
+            content = b''.join(streamed.streaming_content).decode('utf-8')
+            self.assertEqual(json.loads(content), json.loads(buffered.content.decode('utf-8')))
+        self.assertEqual(json.loads(content), [])
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, {
+            'start': '2008-01-05', 'end': '2008-01-10', 'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestOccurrencesPagination(TestCase):
+    def setUp(self):
+        calendar = Calendar.objects.create(
+            name="MyCal", slug='MyCalSlug', timezone=pytz.timezone('America/Detroit'))
+        # 08:00 in Detroit, every day across the 2016-03-13 DST change
+        Event.objects.create(
+            title='Daily', calendar=calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2016, 3, 1, 13, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2016, 3, 1, 14, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2016, 4, 1, 0, 0, tzinfo=pytz.utc))
+        self.url = reverse('api_occurrences')
+        self.params = {'start': '2016-03-10', 'end': '2016-03-17', 'calendar_slug': 'MyCalSlug',
+                       'fields': 'id,start,end'}
+
+    def test_pages_match_unpaginated_across_dst(self):
+        response = self.client.get(self.url, self.params)
+        expected = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(expected[0]['start'], '2016-03-10T13:00:00+00:00')
+        self.assertEqual(expected[-1]['start'], '2016-03-16T12:00:00+00:00')
+        pages = []
+        params = dict(self.params, limit=2)
+        while True:
+            data = json.loads(self.client.get(self.url, params).content.decode('utf-8'))
+            pages += data['occurrences']
+            if data['next_cursor'] is None:
+                break
+            params['cursor'] = data['next_cursor']
+        self.assertEqual(pages, expected)
+
+    def test_cursor_is_bound_to_query(self):
+        data = json.loads(self.client.get(
+            self.url, dict(self.params, limit=2)).content.decode('utf-8'))
+        response = self.client.get(self.url, dict(
+            self.params, limit=2, end='2016-03-18', cursor=data['next_cursor']))
+        self.assertEqual(response.status_code, 400)
+
+    def test_late_page_expands_from_cursor(self):
+        calendar = Calendar.objects.create(name="Old", slug='OldSlug', timezone=pytz.utc)
+        rules = [Rule.objects.create(frequency="HOURLY"),
+                 Rule.objects.create(frequency="DAILY", params="byhour:8,20")]
+        for rule in rules:
+            Event.objects.create(
+                title='Old', calendar=calendar, rule=rule,
+                start=datetime.datetime(1995, 1, 1, 8, 0, tzinfo=pytz.utc),
+                end=datetime.datetime(1995, 1, 1, 8, 30, tzinfo=pytz.utc))
+        start = datetime.datetime(2016, 1, 1, tzinfo=pytz.utc)
+        end = datetime.datetime(2016, 1, 2, tzinfo=pytz.utc)
+        fields = ['id', 'start', 'end']
+        expected = _api_occurrences_page(start, end, 'OldSlug', 20, fields=fields)['occurrences']
+        page = _api_occurrences_page(start, end, 'OldSlug', 10, fields=fields)
+        stats = instrumentation.start()
+        try:
+            page = _api_occurrences_page(start, end, 'OldSlug', 10, page['next_cursor'],
+                                         fields=fields)
+        finally:
+            instrumentation.stop()
+        self.assertEqual(page['occurrences'], expected[10:])
+        # about a day of slack and a page per event, not two decades of them
+        self.assertLess(stats.counters['occurrences_generated'], 100)
+
+
+class TestLiveNow(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.livenow_cache = livenow.LIVENOW_CACHE
+        livenow.LIVENOW_CACHE = 'default'
+        self.calendar = Calendar.objects.create(name="MyCal", slug='MyCalSlug')
+        self.url = reverse('live_now')
+
+    def tearDown(self):
+        livenow.LIVENOW_CACHE = self.livenow_cache
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url, {'calendar_slug': 'MyCalSlug'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content.decode()), [])
+        response = self.client.get(self.url, {'calendar_slug': 'MyCalSlug'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_response_cached_until_next_start(self):
+        now = timezone.now()
+        start = now + datetime.timedelta(minutes=1)
+        Event.objects.create(title='Upcoming', start=start, end=start + datetime.timedelta(hours=1),
+                             calendar=self.calendar)
+        payload = _live_now_payload(now, 'MyCalSlug')
+        self.assertEqual(payload['expires'], start - livenow.LIVENOW_WINDOW)
+
+    def test_writes_invalidate_cached_response(self):
+        self.client.get(self.url, {'calendar_slug': 'MyCalSlug'})
+        self.assertIsNotNone(livenow.get_cached('MyCalSlug', timezone.now()))
+        start = timezone.now() + datetime.timedelta(days=1)
+        Event.objects.create(title='Tomorrow', start=start, end=start + datetime.timedelta(hours=1),
+                             calendar=self.calendar)
+        self.assertIsNone(livenow.get_cached('MyCalSlug', timezone.now()))
+
+    def test_expired_response_served_while_recomputing(self):
+        now = timezone.now()
+        stale = _live_now_payload(now, 'MyCalSlug')
+        stale['expires'] = now - datetime.timedelta(seconds=1)
+        livenow.set_cached('MyCalSlug', stale, now)
+        cache.add(livenow.lock_key('MyCalSlug'), True)
+        payload = livenow.get_or_compute('MyCalSlug', now, lambda: self.fail('recomputed'))
+        self.assertEqual(payload, stale)
+        cache.delete(livenow.lock_key('MyCalSlug'))
+        payload = livenow.get_or_compute('MyCalSlug', now, lambda: _live_now_payload(now, 'MyCalSlug'))
+        self.assertGreater(payload['expires'], now)
+
+    def test_unchanged_recompute_keeps_last_modified(self):
+        now = timezone.now()
+        stale = _live_now_payload(now - datetime.timedelta(minutes=10), 'MyCalSlug')
+        stale['expires'] = now - datetime.timedelta(seconds=1)
+        livenow.set_cached('MyCalSlug', stale, now)
+        payload = livenow.get_or_compute('MyCalSlug', now, lambda: _live_now_payload(now, 'MyCalSlug'))
+        self.assertEqual(payload['last_modified'], stale['last_modified'])
+        self.assertGreater(payload['expires'], now)
+
+
+class TestBulkUpdateOccurrences(TestCase):
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.calendar = Calendar.objects.create(name="MyCal", slug='MyCalSlug')
+        self.event = Event.objects.create(
+            title='Daily', calendar=self.calendar, rule=Rule.objects.create(frequency="DAILY"),
+            start=datetime.datetime(2008, 1, 5, 8, 0, tzinfo=pytz.utc),
+            end=datetime.datetime(2008, 1, 5, 9, 0, tzinfo=pytz.utc),
+            end_recurring_period=datetime.datetime(2008, 2, 5, 0, 0, tzinfo=pytz.utc))
+        self.url = reverse('api_bulk_update_occurrences') + '?calendar_slug=MyCalSlug'
+
+    def post(self, data):
+        return self.client.post(self.url, json.dumps(data), content_type='application/json')
+
+    def test_cancel_week(self):
+        persisted = self.event.get_occurrences(
+            datetime.datetime(2008, 1, 7, tzinfo=pytz.utc), datetime.datetime(2008, 1, 8, tzinfo=pytz.utc))[0]
+        persisted.save()
+        identifiers = [{'id': persisted.pk}] + [
+            {'event_id': self.event.pk, 'original_start': '2008-01-%02dT08:00:00Z' % day} for day in range(8, 14)]
+        response = self.post({'occurrences': identifiers, 'cancelled': True})
+        self.assertEqual(response.status_code, 200)
+        data = json.loads(response.content.decode('utf-8'))
+        self.assertEqual(data['status'], 'OK')
+        self.assertEqual(len(data['occurrences']), 7)
+        self.assertEqual(Occurrence.objects.filter(cancelled=True).count(), 7)
+
+    def test_malformed_body(self):
+        for data in ([], "x", {'occurrences': {}}, {'occurrences': [1]}, {'cancelled': True}):
+            self.assertEqual(self.post(data).status_code, 400)
+
+    def test_unknown_original_start(self):
+        response = self.post({'occurrences': [
+            {'event_id': self.event.pk, 'original_start': '2008-01-08T08:30:00Z'}], 'cancelled': True})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Occurrence.objects.exists())